@@ -1,13 +1,48 @@
 from flask import Flask
 from importlib import import_module
+from apps.profiling import init_profiler
+from apps.startup import StartupReport, preload_deferred_imports
 
-def register_blueprints(app):
-    for module_name in ('apiserver', 'bulkmetering', 'ordinarymetering'):
-        module = import_module(f'apps.{module_name}.routes')
-        app.register_blueprint(module.blueprint)
+BLUEPRINT_MODULES = ('apiserver', 'bulkmetering', 'ordinarymetering', 'batch')
+
+# Modules whose init_app must run before a blueprint is served, even when they are
+# not enabled themselves: every blueprint validates tokens against auth.db, and
+# batch runs the bulk and ordinary handlers
+BLUEPRINT_DEPENDENCIES = {
+    'apiserver': (),
+    'bulkmetering': ('apiserver',),
+    'ordinarymetering': ('apiserver',),
+    'batch': ('apiserver', 'bulkmetering', 'ordinarymetering'),
+}
+
+def register_blueprints(app, report):
+    for module_name in app.config['ENABLED_BLUEPRINTS']:
+        if module_name not in BLUEPRINT_MODULES:
+            raise ValueError(f"Unknown blueprint '{module_name}' in ENABLED_BLUEPRINTS; "
+                             f"expected some of {', '.join(BLUEPRINT_MODULES)}")
+    initialized = {}
+    for module_name in app.config['ENABLED_BLUEPRINTS']:
+        for name in BLUEPRINT_DEPENDENCIES[module_name] + (module_name,):
+            if name in initialized:
+                continue
+            with report.phase(f'import {name}'):
+                module = initialized[name] = import_module(f'apps.{name}.routes')
+            with report.phase(f'init {name}'):
+                # Schema creation, log handlers and similar side effects run here, once per app
+                init_app = getattr(module, 'init_app', None)
+                if init_app is not None:
+                    init_app(app)
+        app.register_blueprint(initialized[module_name].blueprint)
 
 def create_app(config):
-    app = Flask(__name__)
-    app.config.from_object(config)
-    register_blueprints(app)
+    report = StartupReport()
+    with report.phase('flask'):
+        app = Flask(__name__)
+        app.config.from_object(config)
+    register_blueprints(app, report)
+    with report.phase('profiler'):
+        init_profiler(app)
+    if app.config['STARTUP_PRELOAD_IMPORTS']:
+        preload_deferred_imports(report)
+    report.finish(app)
     return app
@@ -5,16 +5,22 @@ import secrets
 import time
 import logging
 import json
+import hmac
+import threading
+from collections import OrderedDict
+# authlib stays a module-level import, unlike jwt: OAuth2AuthorizationServer subclasses
+# AuthorizationServer and every blueprint catches OAuth2Error, so both are needed as soon
+# as this module loads, and any authlib.oauth2 import runs the whole package (~40 ms)
 from authlib.oauth2.rfc6749 import OAuth2Error, AuthorizationServer
 from authlib.oauth2.rfc6749.grants import ClientCredentialsGrant
-import jwt
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
 from apps.config import Config
+from apps.startup import lazy_import
+from apps.apiserver.revocation import revocation_list, write_revocation_filter
 from flask import g
 import datetime
 
+jwt = lazy_import('jwt')
+
 # Constants
 DB_FILE = "apps/apiserver/auth.db"
 TOKEN_EXPIRATION_TIME = 3600  # 1 hour for access token
@@ -22,6 +28,9 @@ REFRESH_TOKEN_EXPIRATION_TIME = 3600  # 1 hour for refresh token
 DEFAULT_USAGE_COUNT = 5
 SECRET_KEY = Config.SECRET_KEY  # Store securely in environment variables
 ALGORITHM = Config.HASH_ALGORITHM  # HMAC SHA-256 for signing JWTs
+TOKEN_VALIDATION_MODE = Config.TOKEN_VALIDATION_MODE
+PASSWORD_HASH_SCHEME = "pbkdf2_sha256"
+PASSWORD_HASH_ITERATIONS = Config.CLIENT_SECRET_HASH_ITERATIONS
 
 def execute_query(query, params=None, fetch=False, commit=False):
     try:
@@ -69,6 +78,14 @@ def initialize_database():
         )
         ''', commit=True)
 
+        execute_query('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti TEXT PRIMARY KEY,
+            client_id TEXT,
+            expires_at INTEGER NOT NULL
+        )
+        ''', commit=True)
+
     except sqlite3.DatabaseError as e:
         logging.error(f"Error initializing database schema: {e}")
         raise
@@ -100,15 +117,33 @@ def retrieve_clients_from_db():
         for row in rows
     ]
 
+def get_client_from_db(client_id):
+    """Fetch a single client record by client_id, or None if it does not exist."""
+    rows = execute_query("""
+        SELECT client_id, client_secret, grant_type, scope, permissions
+        FROM clients
+        WHERE client_id = ?
+        """, (client_id,), fetch=True)
+    if not rows:
+        return None
+    row = rows[0]
+    return {
+        "client_id": row[0],
+        "client_secret": row[1],
+        "grant_type": row[2],
+        "scope": row[3],
+        "permissions": row[4]
+    }
+
 def add_client_to_db(client_data):
-    """Insert a new client record into the database."""
+    """Insert a new client record into the database; the secret is stored hashed."""
     try:
         execute_query("""
             INSERT INTO clients (client_id, client_secret, grant_type, scope, permissions) 
             VALUES (?, ?, ?, ?, ?)
         """, (
             client_data["client_id"],
-            client_data["client_secret"],
+            hash_password(client_data["client_secret"]),
             client_data.get("grant_type", "client_credentials"),
             client_data.get("scope", "read"),
             client_data.get("permissions", "none"), 
@@ -157,17 +192,162 @@ def get_token_from_db(access_token):
     }
     return token
 
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=64)
+
 def hash_password(password: str) -> str:
-    """Hash a password using PBKDF2 for secure storage."""
+    """Hash a password using PBKDF2 for secure storage.
+
+    The result is self-describing ("pbkdf2_sha256$<iterations>$<salt>$<hash>")
+    so the iteration count can be raised later without breaking stored hashes.
+    """
     salt = secrets.token_bytes(16)
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=64,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    return base64.urlsafe_b64encode(kdf.derive(password.encode())).decode()
+    derived = _pbkdf2(password, salt, PASSWORD_HASH_ITERATIONS)
+    return "$".join([
+        PASSWORD_HASH_SCHEME,
+        str(PASSWORD_HASH_ITERATIONS),
+        base64.urlsafe_b64encode(salt).decode(),
+        base64.urlsafe_b64encode(derived).decode(),
+    ])
+
+def is_password_hashed(stored: str) -> bool:
+    return stored.startswith(PASSWORD_HASH_SCHEME + "$")
+
+def verify_password(password: str, stored: str) -> bool:
+    """Check a password against a stored hash; legacy plaintext values are compared directly."""
+    if not is_password_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        derived = _pbkdf2(password, base64.urlsafe_b64decode(salt), int(iterations))
+    except ValueError:
+        logging.error("Malformed client secret hash in the clients table.")
+        return False
+    return hmac.compare_digest(derived, base64.urlsafe_b64decode(expected))
+
+class SecretVerificationCache:
+    """Short-lived, bounded record of recently verified client credentials.
+
+    PBKDF2 makes every secret check deliberately slow, which would turn bursts
+    of token requests into CPU-bound work. Entries are keyed by an HMAC (under
+    SECRET_KEY) of the client id, the presented secret and the stored hash, so
+    no secret is kept in memory and rotating a secret invalidates its entry.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(client_id, client_secret, stored_hash):
+        message = "\0".join((client_id, client_secret, stored_hash)).encode()
+        return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).digest()
+
+    def contains(self, client_id, client_secret, stored_hash):
+        key = self._key(client_id, client_secret, stored_hash)
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def add(self, client_id, client_secret, stored_hash):
+        if self.max_size <= 0:
+            return
+        key = self._key(client_id, client_secret, stored_hash)
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+secret_cache = SecretVerificationCache(Config.CLIENT_SECRET_CACHE_TTL, Config.CLIENT_SECRET_CACHE_SIZE)
+
+def verify_client_secret(client_data, client_secret):
+    """Verify a presented secret against a client record, upgrading legacy plaintext secrets."""
+    client_id, stored = client_data['client_id'], client_data['client_secret']
+    if secret_cache.contains(client_id, client_secret, stored):
+        return True
+    if not verify_password(client_secret, stored):
+        return False
+    if not is_password_hashed(stored):
+        stored = hash_password(client_secret)
+        execute_query("""
+            UPDATE clients SET client_secret = ? WHERE client_id = ? AND client_secret = ?
+        """, (stored, client_id, client_data['client_secret']), commit=True)
+        logging.info(f"Upgraded the stored secret of client {client_id} to a hash.")
+    secret_cache.add(client_id, client_secret, stored)
+    return True
+
+_jwt_keys = {}
+
+def _jwt_key(private):
+    """SECRET_KEY for HMAC algorithms, otherwise the PEM private (signing) or public (verifying) key."""
+    if ALGORITHM.startswith("HS"):
+        return SECRET_KEY
+    setting = "JWT_PRIVATE_KEY_PATH" if private else "JWT_PUBLIC_KEY_PATH"
+    path = getattr(Config, setting)
+    if not path:
+        raise RuntimeError(f"{setting} must be set to use {ALGORITHM} access tokens.")
+    key = _jwt_keys.get(path)
+    if key is None:
+        with open(path, "rb") as f:
+            key = _jwt_keys[path] = f.read()
+    return key
+
+def decode_access_token(access_token, verify_exp=True):
+    """Verify an access token's signature (and expiry) and return its claims; raises jwt.InvalidTokenError."""
+    return jwt.decode(access_token, _jwt_key(private=False), algorithms=[ALGORITHM],
+                      options={"require": ["exp", "iat"], "verify_exp": verify_exp})
+
+_publish_lock = threading.Lock()
+_publish_timer = None
+
+def publish_revocations():
+    """Drop expired revocations and publish the rest as the revocation filter."""
+    global _publish_timer
+    with _publish_lock:
+        _publish_timer = None
+    try:
+        execute_query("DELETE FROM revoked_tokens WHERE expires_at <= ?", (int(time.time()),), commit=True)
+        rows = execute_query("SELECT jti FROM revoked_tokens", fetch=True)
+        write_revocation_filter(row[0] for row in rows)
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"Failed to publish the token revocation filter: {e}")
+
+def schedule_revocation_publish():
+    """Publish after a short delay, so a burst of re-issued tokens produces one filter write."""
+    global _publish_timer
+    with _publish_lock:
+        if _publish_timer is None:
+            _publish_timer = threading.Timer(Config.REVOCATION_PUBLISH_DELAY_SECONDS, publish_revocations)
+            _publish_timer.daemon = True
+            _publish_timer.start()
+
+def record_revoked_tokens(access_tokens):
+    """Record the ids of unexpired access tokens this server issued as revoked, for stateless validators."""
+    now = int(time.time())
+    revoked = 0
+    for access_token in access_tokens:
+        try:
+            # Callers pass only tokens read from the tokens table or already verified
+            claims = jwt.decode(access_token, options={"verify_signature": False})
+        except jwt.InvalidTokenError:
+            continue
+        if not claims.get("jti") or claims.get("exp", 0) <= now:
+            continue
+        execute_query("""
+            INSERT OR IGNORE INTO revoked_tokens (jti, client_id, expires_at) VALUES (?, ?, ?)
+        """, (claims["jti"], claims.get("client_id"), int(claims["exp"])), commit=True)
+        revoked += 1
+    if revoked:
+        schedule_revocation_publish()
 
 def is_token_expired(expires_at):
     current_time = datetime.datetime.utcnow()
@@ -184,15 +364,21 @@ class OAuth2AuthorizationServer(AuthorizationServer):
             "permissions": client.permissions,
             "exp": time.time() + TOKEN_EXPIRATION_TIME,  # Expiration time for access token
             "iat": time.time(),  # Issued at time
+            "jti": secrets.token_urlsafe(16),  # Token id, lets validators reject it once revoked
         }
 
         # Generate access token (JWT)
-        access_token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+        access_token = jwt.encode(payload, _jwt_key(private=True), algorithm=ALGORITHM)
 
         # Generate refresh token (Random string to be stored securely)
         refresh_token = base64.urlsafe_b64encode(secrets.token_bytes(32)).decode('utf-8').rstrip('=')
         refresh_token_expiry = int(time.time()) + REFRESH_TOKEN_EXPIRATION_TIME
         print(client.client_id)
+        # The client's previous tokens are replaced, so stateless validators must reject them too
+        previous = execute_query("""
+            SELECT access_token FROM tokens WHERE client_id = ?
+        """, (client.client_id,), fetch=True)
+        record_revoked_tokens(row[0] for row in previous)
         execute_query("""
             DELETE FROM tokens WHERE client_id = ?
         """, (client.client_id,), commit=True)
@@ -229,7 +415,7 @@ class OAuth2AuthorizationServer(AuthorizationServer):
                     raise OAuth2Error(error="invalid_grant", description="Refresh token is expired.")
                 if entry['refresh_token'] == hashed_refresh_token and time.time() < entry['expires_at'] and entry['usage_count']>0:
                     # If the refresh token is valid, issue a new access token
-                    client_data = next(client for client in retrieve_clients_from_db() if client['client_id'] == client_id)
+                    client_data = get_client_from_db(client_id)
                     new_access_token = self.generate_jwt_token(OAuth2Client(
                         client_id=client_id,
                         client_secret="dummy",
@@ -246,11 +432,10 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         client_id = request.form.get('client_id')
         client_secret = request.form.get('client_secret')
 
-        if grant_type == 'client_credentials':
-            clients = retrieve_clients_from_db()
-            client_data = next((client for client in clients if client['client_id'] == client_id), None)
+        if grant_type == 'client_credentials' and client_id and client_secret:
+            client_data = get_client_from_db(client_id)
 
-            if client_data and client_data['client_secret'] == client_secret: 
+            if client_data and verify_client_secret(client_data, client_secret):
                 return OAuth2Client(
                     client_id=client_id,
                     client_secret=client_secret,
@@ -265,27 +450,48 @@ class OAuth2AuthorizationServer(AuthorizationServer):
     def revoke_token(self, token):
         #will be used for cleaning abandonded tokens
         hashed_token = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        # Access tokens are stored as issued, refresh tokens hashed
+        rows = execute_query("""
+            SELECT access_token FROM tokens WHERE access_token = ? OR refresh_token = ?
+        """, (token, hashed_token), fetch=True)
+        revoked = [row[0] for row in rows]
+        try:
+            decode_access_token(token)
+            revoked.append(token)
+        except jwt.InvalidTokenError:
+            pass
+        record_revoked_tokens(revoked)
         execute_query("""
             DELETE FROM tokens WHERE access_token = ? OR refresh_token = ?
-        """, (hashed_token, hashed_token), commit=True)
+        """, (token, hashed_token), commit=True)
         return {"message": "Token revoked successfully"}
 
     def get_scope(client_id):
-        clients = retrieve_clients_from_db()
-        client_data = next((client for client in clients if client['client_id'] == client_id), None)
+        client_data = get_client_from_db(client_id)
         if not client_data:
             raise OAuth2Error(error="invalid_client", description="Client not found.")
         return client_data.get('scope', [])
 
     def get_permissions(client_id):
-        clients = retrieve_clients_from_db()
-        client_data = next((client for client in clients if client['client_id'] == client_id), None)
+        client_data = get_client_from_db(client_id)
         if not client_data:
             raise OAuth2Error(error="invalid_client", description="Client not found.")
         return client_data.get('permissions', [])
 
     def validate_access_token(self, access_token):
         try:
+            if TOKEN_VALIDATION_MODE == 'stateless':
+                payload = decode_access_token(access_token)
+                if 'jti' in payload:
+                    # Checked against what the issuer published, not this node's auth.db
+                    revoked = revocation_list.is_revoked(payload['jti'])
+                else:
+                    # Issued before tokens carried an id; only the database knows if it was replaced
+                    revoked = get_token_from_db(access_token) is None
+                if revoked:
+                    raise OAuth2Error(error="invalid_token", description="The provided token is invalid or revoked.")
+                return payload
+
             token_info = get_token_from_db(access_token)
             if not token_info:
                 raise OAuth2Error(error="invalid_token", description="The provided token is invalid or revoked.")
@@ -293,7 +499,7 @@ class OAuth2AuthorizationServer(AuthorizationServer):
             if is_token_expired(token_info['expires_at']):
                 raise OAuth2Error(error="token_expired", description="The access token has expired.")
             
-            payload = jwt.decode(access_token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = decode_access_token(access_token)
             return payload
 
         except jwt.ExpiredSignatureError:
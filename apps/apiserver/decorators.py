@@ -1,13 +1,12 @@
-import jwt
 from functools import wraps
 from flask import request, jsonify, g
-from apps.config import Config
-from apps.apiserver.authServer import OAuth2AuthorizationServer, OAuth2Error
+from apps.startup import lazy_import
+from apps.apiserver.authServer import TOKEN_VALIDATION_MODE, OAuth2AuthorizationServer, OAuth2Error, decode_access_token
 from functools import wraps
 
+jwt = lazy_import('jwt')
+
 # Constants
-SECRET_KEY = Config.SECRET_KEY
-ALGORITHM = Config.HASH_ALGORITHM
 AUTH_HEADER = "Authorization"
 BEARER_PREFIX = "Bearer"
 
@@ -21,7 +20,7 @@ def extract_access_token():
 def decode_token(token):
     """Decode the JWT token and handle potential errors."""
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return decode_access_token(token)
     except jwt.ExpiredSignatureError:
         raise ValueError("token_expired")
     except jwt.InvalidTokenError:
@@ -33,6 +32,14 @@ def handle_error(error_key, description, status_code):
     # logger.error(f"Error: {error_key}, Description: {description}")
     return jsonify(error=error_key, description=description), status_code
 
+def service_unavailable(error):
+    """Return a 503 error payload for a DatabaseUnavailable error, with a Retry-After hint."""
+    return (
+        {"error": "service_unavailable", "description": "The metering database is temporarily unavailable."},
+        503,
+        {"Retry-After": str(error.retry_after or 1)},
+    )
+
 def requires_scope(required_scope):
     """Decorator to check if the client has the required scope (endpoint access)."""
     def decorator(f):
@@ -45,7 +52,11 @@ def requires_scope(required_scope):
             try:
                 payload = decode_token(token)
                 client_id = payload.get("client_id")
-                token_scope = OAuth2AuthorizationServer.get_scope(client_id) or []
+                if TOKEN_VALIDATION_MODE == 'stateless':
+                    # The signed claims are authoritative; no lookup in auth.db
+                    token_scope = payload.get("scope") or []
+                else:
+                    token_scope = OAuth2AuthorizationServer.get_scope(client_id) or []
                 
                 if required_scope not in token_scope:
                     return handle_error("insufficient_scope", f"Required scope: {required_scope}", 403)
@@ -72,7 +83,10 @@ def requires_permission(required_permission):
             try:
                 payload = decode_token(token)
                 client_id = payload.get("client_id")
-                token_permissions = OAuth2AuthorizationServer.get_permissions(client_id) or []
+                if TOKEN_VALIDATION_MODE == 'stateless':
+                    token_permissions = payload.get("permissions") or []
+                else:
+                    token_permissions = OAuth2AuthorizationServer.get_permissions(client_id) or []
                 
                 if required_permission not in token_permissions:
                     return handle_error("insufficient_permission", f"Required permission: {required_permission}", 403)
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+from apps.config import Config
+
+REVOCATION_LIST_PATH = Config.REVOCATION_LIST_PATH
+REFRESH_SECONDS = Config.REVOCATION_REFRESH_SECONDS
+FALSE_POSITIVE_RATE = Config.REVOCATION_FALSE_POSITIVE_RATE
+
+# File layout: magic, format version, bit count, hash count, the bit array,
+# then the exact token ids, newline-separated
+HEADER = struct.Struct('>4sBIB')
+MAGIC = b'RVBF'
+VERSION = 2
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over token ids, using double hashing of one SHA-256 digest."""
+
+    def __init__(self, size_bits, hash_count, bits=None):
+        self.size_bits = size_bits
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        size_bits = max(64, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        hash_count = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, hash_count)
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return ((h1 + i * h2) % self.size_bits for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_bytes(self):
+        return HEADER.pack(MAGIC, VERSION, self.size_bits, self.hash_count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse a filter from the start of `data`; returns the filter and the bytes that follow it."""
+        magic, version, size_bits, hash_count = HEADER.unpack_from(data)
+        end = HEADER.size + (size_bits + 7) // 8
+        if magic != MAGIC or version != VERSION or len(data) < end:
+            raise ValueError('not a revocation filter file')
+        return cls(size_bits, hash_count, bytearray(data[HEADER.size:end])), data[end:]
+
+
+def write_revocation_filter(token_ids, path=REVOCATION_LIST_PATH):
+    """Build a filter of the given token ids and atomically replace the published file.
+
+    The exact ids are written after the filter, so validators that do not share
+    the issuer's database can still tell a revoked token from a false positive.
+    """
+    token_ids = list(token_ids)
+    bloom = BloomFilter.for_capacity(len(token_ids))
+    for token_id in token_ids:
+        bloom.add(token_id)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(bloom.to_bytes())
+        f.write('\n'.join(token_ids).encode('utf-8'))
+    os.replace(temp_path, path)
+    return bloom
+
+
+class RevocationList:
+    """The published revocation filter, re-read when the file changes, at most every `refresh_seconds`.
+
+    Lookups never touch the database: a miss means the token is not revoked.
+    A hit may be a false positive, so it is confirmed against the exact ids
+    published with the filter, which are only parsed once a hit needs them.
+    """
+
+    def __init__(self, path=REVOCATION_LIST_PATH, refresh_seconds=REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        # (filter, raw id list, parsed id set or None); swapped as a whole on reload
+        self._published = None
+        self._mtime = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at < self.refresh_seconds:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                with open(self.path, 'rb') as f:
+                    bloom, token_ids = BloomFilter.from_bytes(f.read())
+                self._published = [bloom, token_ids, None]
+                self._mtime = mtime
+            except FileNotFoundError:
+                # Nothing has been revoked yet
+                self._published, self._mtime = None, None
+            except (OSError, ValueError, struct.error) as e:
+                logging.error(f"Could not load the token revocation filter, keeping the previous one: {e}")
+
+    def is_revoked(self, token_id):
+        self._refresh()
+        published = self._published
+        if published is None or token_id not in published[0]:
+            return False
+        if published[2] is None:
+            published[2] = frozenset(published[1].decode('utf-8').split('\n'))
+        return token_id in published[2]
+
+
+revocation_list = RevocationList()
@@ -10,12 +10,15 @@ from apps.apiserver.authServer import initialize_database
 from apps.apiserver import blueprint
 
 authorization_server = OAuth2AuthorizationServer()
-initialize_database()
 authorization_server.register_grant(ClientCredentialsGrant)
 
 # Initialize Flask-Limiter for rate limiting
 limiter = Limiter(key_func=get_remote_address)
 
+def init_app(app):
+    """Create the auth schema; run once by create_app rather than on import."""
+    initialize_database()
+
 @blueprint.route('/token', methods=['POST'])
 @limiter.limit("200 per day")
 def issue_token():
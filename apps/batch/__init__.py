@@ -0,0 +1,7 @@
+from flask import Blueprint
+
+blueprint = Blueprint(
+    'batch_blueprint',
+    __name__,
+    url_prefix='/public-api/meters/batch'
+)
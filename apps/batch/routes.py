@@ -0,0 +1,70 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request, g
+from apps.batch import blueprint
+from apps.config import Config
+from apps.serializers import json_response
+from apps.apiserver.decorators import requires_permission, requires_scope, validate_token_and_set_context
+from apps.bulkmetering.routes import (
+    process_bulk_division_summary, process_bulk_retrieve_readings, process_bulk_retrieve_readings_range
+)
+from apps.ordinarymetering.routes import process_retrieve_readings, process_sync_readings
+
+MAX_ITEMS = Config.BATCH_MAX_ITEMS
+
+# Sub-request handlers: each takes (params, client_id) and returns (payload, status[, headers])
+OPERATIONS = {
+    'bulk.retrieve-readings': process_bulk_retrieve_readings,
+    'bulk.retrieve-readings-range': process_bulk_retrieve_readings_range,
+    'bulk.division-summary': process_bulk_division_summary,
+    'ordinary.retrieve-readings': process_retrieve_readings,
+    'ordinary.sync': process_sync_readings,
+}
+
+# Shared by all batch requests of this process, so concurrent DB work stays
+# bounded no matter how many batches arrive at once
+executor = ThreadPoolExecutor(max_workers=Config.BATCH_MAX_WORKERS, thread_name_prefix='batch')
+
+
+def validate_batch_items(items):
+    if not isinstance(items, list) or not items:
+        return False, 'requests must be a non-empty list.'
+    if len(items) > MAX_ITEMS:
+        return False, f'The maximum number of requests per batch is {MAX_ITEMS}.'
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            return False, f'requests[{position}] must be an object.'
+        if item.get('operation') not in OPERATIONS:
+            return False, f'requests[{position}].operation must be one of {", ".join(OPERATIONS)}.'
+    return True, None
+
+
+def run_item(item, client_id):
+    handler = OPERATIONS[item['operation']]
+    try:
+        payload, status, *_ = handler(item.get('params'), client_id)
+    except Exception as e:
+        logging.exception(f"Batch item {item.get('id')} failed: {e}")
+        payload, status = {'error': 'internal_error', 'message': 'An unexpected error occurred.'}, 500
+    return {"id": item.get('id'), "operation": item['operation'], "status": status, "body": payload}
+
+
+@blueprint.route('', methods=['POST'])
+@validate_token_and_set_context
+@requires_scope("retrieve-readings")
+@requires_permission("read")
+def batch():
+    client_id = getattr(g, 'token_info', {}).get('client_id', 'Unknown')
+    data = request.get_json(silent=True)
+    items = data.get('requests') if isinstance(data, dict) else None
+
+    valid, message = validate_batch_items(items)
+    if not valid:
+        logging.warning(message)
+        return json_response({'error': 'invalid_batch', 'message': message}, 400)
+
+    # Authenticated once above; the sub-requests run concurrently on the shared executor
+    results = list(executor.map(lambda item: run_item(item, client_id), items))
+    logging.info({"client_id": client_id, "action": "batch", "operations": [item['operation'] for item in items]})
+    return json_response({"results": results}, 200)
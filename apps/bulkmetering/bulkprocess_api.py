@@ -1,7 +1,9 @@
-import pymssql
+import re
 from apps.config import Config
+from apps.db import db_router, DatabaseUnavailable
+from apps.meterindex import meter_index, BULK_ASSET_TYPE_ID
 from typing import List, Dict
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import logging
 import os
 import json
@@ -10,39 +12,10 @@ import json
 log_dir = os.path.join(os.getcwd(), 'Logs')
 log_file = os.path.join(log_dir, 'bulk_app.log')
 
-# Database configuration
-SMART_METER_CONNECTION_PARAMS = Config.SMART_METER_CONNECTION_PARAMS
-BREAKDOWN_ASSIST_CONNECTION_PARAMS = Config.BREAKDOWN_ASSIST_CONNECTION_PARAMS
-
-def get_db_connection():
-    return pymssql.connect(
-        server=SMART_METER_CONNECTION_PARAMS['server'],
-        user=SMART_METER_CONNECTION_PARAMS['user'],
-        password=SMART_METER_CONNECTION_PARAMS['password'],
-        database=SMART_METER_CONNECTION_PARAMS['database'],
-    )
-    
-def get_db_connection_BA():
-    return pymssql.connect(
-        server=BREAKDOWN_ASSIST_CONNECTION_PARAMS['server'],
-        user=BREAKDOWN_ASSIST_CONNECTION_PARAMS['user'],
-        password=BREAKDOWN_ASSIST_CONNECTION_PARAMS['password'],
-        database=BREAKDOWN_ASSIST_CONNECTION_PARAMS['database'],
-    )
-
-def load_bulk_meter_readings(logical_device_names: List[str], division_id: str, date: str):
-    try:
-        # Validate and format date
-        date_parts = datetime.strptime(date, "%Y-%m-%d").date()
-        if date_parts.day != 1:
-            raise ValueError("Date must be the first of the month.")
-
-        # Convert logical device names list to a format suitable for SQL query
-        device_names_str = ', '.join(f"'{name}'" for name in logical_device_names)
-
-        query = f"""
-        SELECT  
-            mm.LogicalDeviceName AS "mtr_nbr",
+# Billing snapshot columns shared by the single-month and month-range queries.
+# "mtr_nbr" is filled in from the meter index rather than joined from MeterMaster.
+BULK_READING_COLUMNS = """
+            mrbb.MeterId AS "MeterId",
             mrbb.DateTime AS "rdng_date",
             ROUND(mrbb.ActiveEnergyPluse, 0) AS "kwh_tot",
             ROUND(mrbb.ActiveEnergyTariff1Pluse, 0) AS "kwh_r1",
@@ -64,27 +37,140 @@ def load_bulk_meter_readings(logical_device_names: List[str], division_id: str,
             ROUND(mrbb.ReactiveEnergyTariff1Minus, 0) AS "kvarh_r1_exp",
             ROUND(mrbb.ReactiveEnergyTariff2Minus, 0) AS "kvarh_r2_exp",
             ROUND(mrbb.ReactiveEnergyTariff3Minus, 0) AS "kvarh_r3_exp"
-        FROM MeterReadingsBulkBilling mrbb 
-        JOIN MeterMaster mm ON mm.MeterId = mrbb.MeterId 
-        JOIN MeterAssignment ma ON mrbb.MeterId = ma.MeterId 
-        WHERE mm.LogicalDeviceName IN ({device_names_str})
-        AND mm.DivisionId = %s
-        AND CAST(mrbb.DateTime AS DATE) = DATEFROMPARTS(%s, %s, %s)
-        AND ma.AssetTypeId = 2;
-        """
-
-        # Extract year, month, and day from the date for DATEFROMPARTS
-        year, month, day = date_parts.year, date_parts.month, date_parts.day
-
-        with get_db_connection() as conn:
-            with conn.cursor(as_dict=True) as cursor:
-                cursor.execute(query, (division_id, year, month, day))
-                results = cursor.fetchall()
-                return results
+"""
+# Upper bound on MeterIds per IN list when a query covers a whole division
+METER_ID_CHUNK_SIZE = 1000
+
+BULK_READING_KEYS = ('mtr_nbr',) + tuple(re.findall(r'AS "(\w+)"', BULK_READING_COLUMNS))[1:]
+
+def add_months(date_value: date, months: int) -> date:
+    """Return the first day of the month `months` after the month of `date_value`."""
+    month_index = date_value.year * 12 + (date_value.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def month_key(value) -> str:
+    """Format a date/datetime as the YYYY-MM key used by month-range responses."""
+    return f"{value.year:04d}-{value.month:02d}"
+
+def _query_bulk_snapshots(logical_device_names: List[str], division_id: str, range_start: date, range_end: date):
+    # Names are resolved to MeterIds in-process, so the query reads
+    # MeterReadingsBulkBilling directly and unknown meters never reach the DB.
+    resolved, _ = meter_index.resolve(logical_device_names, division_id, BULK_ASSET_TYPE_ID)
+    return _fetch_bulk_snapshots(resolved, range_start, range_end)
+
+def _fetch_bulk_snapshots(resolved: Dict[str, list], range_start: date, range_end: date):
+    names_by_meter_id = {ref.meter_id: name for name, refs in resolved.items() for ref in refs}
+    meter_ids = list(names_by_meter_id)
+
+    results = []
+    for offset in range(0, len(meter_ids), METER_ID_CHUNK_SIZE):
+        chunk = meter_ids[offset:offset + METER_ID_CHUNK_SIZE]
+
+        # Half-open DateTime range so the predicate can seek on the DateTime index;
+        # billing snapshots are taken on the first of each month.
+        placeholders = ', '.join(['%s'] * len(chunk))
+        query = f"""
+            SELECT {BULK_READING_COLUMNS}
+            FROM MeterReadingsBulkBilling mrbb 
+            WHERE mrbb.MeterId IN ({placeholders})
+            AND mrbb.DateTime >= %s
+            AND mrbb.DateTime < %s
+            AND DATEPART(DAY, mrbb.DateTime) = 1
+            ORDER BY mrbb.MeterId, mrbb.DateTime;
+            """
+        params = tuple(chunk) + (range_start, range_end)
+
+        with db_router.cursor('smart_meter') as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        for row in rows:
+            meter_id = row.pop('MeterId')
+            results.append({'mtr_nbr': names_by_meter_id[meter_id], **row})
+    return results
+
+def load_bulk_meter_readings(logical_device_names: List[str], division_id: str, date: str):
+    try:
+        # Validate and format date
+        date_parts = datetime.strptime(date, "%Y-%m-%d").date()
+        if date_parts.day != 1:
+            raise ValueError("Date must be the first of the month.")
+
+        return _query_bulk_snapshots(logical_device_names, division_id, date_parts, date_parts + timedelta(days=1))
+
+    except ValueError as ve:
+        logging.error("Invalid input value: %s", ve)
+        return {'error': 'invalid_input', 'message': str(ve)}
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logging.error("Database error: %s", e)
+        return {'error': 'database_error', 'message': str(e)}
+
+def load_bulk_meter_readings_range(logical_device_names: List[str], division_id: str, start_date: str, end_date: str):
+    """Load the monthly billing snapshots from `start_date` to `end_date` (both first-of-month, inclusive)."""
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if start.day != 1 or end.day != 1:
+            raise ValueError("Dates must be the first of the month.")
+        if start > end:
+            raise ValueError("Start date must not be after end date.")
+
+        return _query_bulk_snapshots(logical_device_names, division_id, start, add_months(end, 1))
+
+    except ValueError as ve:
+        logging.error("Invalid input value: %s", ve)
+        return {'error': 'invalid_input', 'message': str(ve)}
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logging.error("Database error: %s", e)
+        return {'error': 'database_error', 'message': str(e)}
+
+def load_division_bulk_readings(division_id: str, date: str):
+    """Load the billing snapshot of every bulk meter in a division for one month.
+
+    Returns (meter_count, rows): the number of bulk meters in the division and
+    one snapshot per meter that reported. Like the single-device endpoint, the
+    first row is used when a name has several MeterIds or snapshots that day.
+    """
+    try:
+        date_parts = datetime.strptime(date, "%Y-%m-%d").date()
+        if date_parts.day != 1:
+            raise ValueError("Date must be the first of the month.")
+
+        resolved = meter_index.meters_in_division(division_id, BULK_ASSET_TYPE_ID)
+        rows = {}
+        for row in _fetch_bulk_snapshots(resolved, date_parts, date_parts + timedelta(days=1)):
+            rows.setdefault(row['mtr_nbr'], row)
+        return len(resolved), list(rows.values())
 
     except ValueError as ve:
         logging.error("Invalid input value: %s", ve)
         return {'error': 'invalid_input', 'message': str(ve)}
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logging.error("Database error: %s", e)
-        return {'error': 'database_error', 'message': str(e)}
\ No newline at end of file
+        return {'error': 'database_error', 'message': str(e)}
+
+def pivot_device_series(rows: List[Dict]) -> Dict[str, List[Dict]]:
+    """Group snapshot rows into a per-device time series ordered by reading date."""
+    series = {}
+    for row in rows:
+        series.setdefault(row['mtr_nbr'], []).append(row)
+    return series
+
+def pivot_device_months(rows: List[Dict], months: List[str], columns: List[str]) -> Dict[str, Dict[str, List]]:
+    """Pivot snapshot rows into device x month: one list per column, aligned with `months`."""
+    month_index = {month: i for i, month in enumerate(months)}
+    pivot = {}
+    for row in rows:
+        i = month_index.get(month_key(row['rdng_date']))
+        if i is None:
+            continue
+        device = pivot.setdefault(row['mtr_nbr'], {column: [None] * len(months) for column in columns})
+        for column in columns:
+            device[column][i] = row.get(column)
+    return pivot
@@ -1,47 +1,54 @@
 import logging
 import os
-from flask import request, jsonify, g
+from datetime import datetime
+from flask import request, g
 from pythonjsonlogger import jsonlogger
 from apps.bulkmetering import blueprint
-from apps.bulkmetering.bulkprocess_api import load_bulk_meter_readings
-from apps.apiserver.decorators import requires_permission, requires_scope, validate_token_and_set_context
-from apps.bulkmetering.util import validate_date, validate_logical_device_names, validate_division_id
+from apps.bulkmetering.bulkprocess_api import (
+    BULK_READING_KEYS, add_months, load_bulk_meter_readings, load_bulk_meter_readings_range, load_division_bulk_readings,
+    month_key, pivot_device_months, pivot_device_series
+)
+from apps.meterindex import meter_index, BULK_ASSET_TYPE_ID
+from apps.db import DatabaseUnavailable
+from apps.serializers import encode_rows, json_response
+from apps.apiserver.decorators import requires_permission, requires_scope, service_unavailable, validate_token_and_set_context
+from apps.bulkmetering.summary import MAX_TOP_N, summarize_division
+from apps.bulkmetering.util import (
+    validate_date, validate_logical_device_names, validate_division_id, validate_month_range, validate_layout
+)
 
-# Ensure Logs directory exists
 log_dir = 'Logs'
-os.makedirs(log_dir, exist_ok=True)
-
-# Configure logging to use JSON format
-log_handler = logging.FileHandler(f'{log_dir}/bulk_app.log')  # Safe relative path
-formatter = jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(message)s')
-log_handler.setFormatter(formatter)
+LOG_FILE = os.path.join(log_dir, 'bulk_app.log')
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-logger.addHandler(log_handler)
 
 
-@blueprint.route('/retrieve-readings', methods=['POST'])
-@validate_token_and_set_context
-@requires_scope("retrieve-readings")
-@requires_permission("read")
-def bulk_retrieve_readings():
-    try:
-        
-        # Extract client_id from token info
-        client_id = getattr(g, 'token_info', {}).get('client_id', 'Unknown')
+def init_app(app):
+    """Attach the JSON file log handler; run once by create_app rather than on import."""
+    path = os.path.abspath(LOG_FILE)
+    if any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        return
+    os.makedirs(log_dir, exist_ok=True)
+    log_handler = logging.FileHandler(LOG_FILE)  # Safe relative path
+    log_handler.setFormatter(jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.setLevel(logging.INFO)
+    logger.addHandler(log_handler)
 
-        # Parse JSON body
-        data = request.get_json()
+
+def process_bulk_retrieve_readings(data, client_id):
+    """Handle a bulk readings request body; returns (payload, status[, headers])."""
+    try:
+        if not isinstance(data, dict):
+            return {'error': 'invalid_request', 'message': 'Request body must be a JSON object.'}, 400
 
         required_params = ['logical_device_names', 'division_id', 'date']
         missing_params = [param for param in required_params if param not in data]
 
         if missing_params:
-            return jsonify({
+            return {
                 'error': 'missing_parameters',
                 'message': f'Missing parameters: {", ".join(missing_params)}'
-            }), 400
+            }, 400
 
         logical_device_names = data['logical_device_names']
         division_id = data['division_id']
@@ -51,26 +58,39 @@ def bulk_retrieve_readings():
 
         # Validate logical device names
         invalid_names, message = validate_logical_device_names(logical_device_names)
+        if invalid_names is False:
+            return {'error': 'invalid_logical_device_names', 'message': message}, 400
         if invalid_names:
             logger.warning({"client_id": client_id, "error": "Invalid logical_device_names", "invalid_names": invalid_names})
-            #return jsonify({'error': 'invalid_logical_device_names', 'message': message}), 400
+            #return {'error': 'invalid_logical_device_names', 'message': message}, 400
 
         # Validate division ID
         valid, message = validate_division_id(division_id)
         if not valid:
             logger.warning({"client_id": client_id, "error": "Invalid division_id", "message": message})
-            return jsonify({'error': 'invalid_division_id', 'message': message}), 400
+            return {'error': 'invalid_division_id', 'message': message}, 400
 
         # Validate date
         valid, message = validate_date(date)
         if not valid:
             logger.warning({"client_id": client_id, "error": "Invalid date", "message": message})
-            return jsonify({'error': 'invalid_date', 'message': message}), 400
+            return {'error': 'invalid_date', 'message': message}, 400
+
+        # Reject unknown and wrong-division meters before touching the DB
+        valid_names = [name for name in logical_device_names if name not in invalid_names]
+        _, rejected = meter_index.resolve(valid_names, division_id, BULK_ASSET_TYPE_ID)
 
         # Process valid device names
         for name in logical_device_names:
             try:
-                if name not in invalid_names:
+                if name in rejected:
+                    results.append({
+                        "logical_device_name": name,
+                        "reading_status": "unsuccessful",
+                        "data": None,
+                        "message": rejected[name]
+                    })
+                elif name not in invalid_names:
                     result = load_bulk_meter_readings([name], division_id, date)
                     results.append({
                         "logical_device_name": name,
@@ -83,6 +103,8 @@ def bulk_retrieve_readings():
                         "reading_status": "validation_failed",
                         "message": f'Logical device name "{name}" is invalid. Only alphanumeric characters are allowed.'
                     })
+            except DatabaseUnavailable:
+                raise
             except Exception as e:
                 logger.error({"client_id": client_id, "error": f"Error retrieving reading for device {name}", "exception": str(e)})
                 results.append({
@@ -91,11 +113,219 @@ def bulk_retrieve_readings():
                     "message": str(e)
                 })
 
+        encode_rows([result["data"] for result in results if result.get("data")])
+
         # Log successful access
         logger.info({"client_id": client_id, "action": "bulk_retrieve_readings", "retrieved_data": results})
 
-        return jsonify({"result": results}), 200
+        return {"result": results}, 200
 
+    except DatabaseUnavailable as e:
+        logger.error({"client_id": client_id, "error": "Database unavailable", "exception": str(e)})
+        return service_unavailable(e)
     except Exception as e:
-        logger.exception({"client_id": getattr(g, 'token_info', {}).get('client_id', 'Unknown'), "error": "Unexpected error", "exception": str(e)})
-        return jsonify({'error': 'internal_server_error', 'message': str(e)}), 500
+        logger.exception({"client_id": client_id, "error": "Unexpected error", "exception": str(e)})
+        return {'error': 'internal_server_error', 'message': str(e)}, 500
+
+
+@blueprint.route('/retrieve-readings', methods=['POST'])
+@validate_token_and_set_context
+@requires_scope("retrieve-readings")
+@requires_permission("read")
+def bulk_retrieve_readings():
+    client_id = getattr(g, 'token_info', {}).get('client_id', 'Unknown')
+    return json_response(*process_bulk_retrieve_readings(request.get_json(silent=True), client_id))
+
+
+def process_bulk_retrieve_readings_range(data, client_id):
+    """Handle a month-range bulk readings request body; returns (payload, status[, headers])."""
+    try:
+        if not isinstance(data, dict):
+            return {'error': 'invalid_request', 'message': 'Request body must be a JSON object.'}, 400
+
+        required_params = ['logical_device_names', 'division_id', 'start_date', 'end_date']
+        missing_params = [param for param in required_params if param not in data]
+
+        if missing_params:
+            return {
+                'error': 'missing_parameters',
+                'message': f'Missing parameters: {", ".join(missing_params)}'
+            }, 400
+
+        logical_device_names = data['logical_device_names']
+        division_id = data['division_id']
+        start_date = data['start_date']
+        end_date = data['end_date']
+        layout = data.get('layout', 'series')
+        pivot_columns = data.get('pivot_columns', ['kwh_tot'])
+
+        # Validate logical device names
+        invalid_names, message = validate_logical_device_names(logical_device_names)
+        if invalid_names is False:
+            return {'error': 'invalid_logical_device_names', 'message': message}, 400
+        if invalid_names:
+            logger.warning({"client_id": client_id, "error": "Invalid logical_device_names", "invalid_names": invalid_names})
+
+        # Validate division ID
+        valid, message = validate_division_id(division_id)
+        if not valid:
+            logger.warning({"client_id": client_id, "error": "Invalid division_id", "message": message})
+            return {'error': 'invalid_division_id', 'message': message}, 400
+
+        # Validate month range
+        valid, message = validate_month_range(start_date, end_date)
+        if not valid:
+            logger.warning({"client_id": client_id, "error": "Invalid date range", "message": message})
+            return {'error': 'invalid_date_range', 'message': message}, 400
+
+        # Validate layout and pivot columns
+        valid, message = validate_layout(layout)
+        if not valid:
+            return {'error': 'invalid_layout', 'message': message}, 400
+        if (not isinstance(pivot_columns, list) or not pivot_columns
+                or any(column not in BULK_READING_KEYS for column in pivot_columns)):
+            return {
+                'error': 'invalid_pivot_columns',
+                'message': f'Pivot columns must be a non-empty list drawn from: {", ".join(BULK_READING_KEYS)}'
+            }, 400
+
+        valid_names = [name for name in logical_device_names if name not in invalid_names]
+        _, rejected = meter_index.resolve(valid_names, division_id, BULK_ASSET_TYPE_ID)
+        valid_names = [name for name in valid_names if name not in rejected]
+        rows = load_bulk_meter_readings_range(valid_names, division_id, start_date, end_date) if valid_names else []
+        if isinstance(rows, dict):
+            logger.error({"client_id": client_id, "error": "Error retrieving reading range", "exception": rows['message']})
+            return rows, 400 if rows['error'] == 'invalid_input' else 500
+
+        # One query for every device and month, pivoted here rather than per call
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        months = []
+        month = start
+        while month <= end:
+            months.append(month_key(month))
+            month = add_months(month, 1)
+
+        if layout == 'pivot':
+            # Pivoting reads rdng_date as a date; the few values it keeps are left to json_response
+            devices = pivot_device_months(rows, months, pivot_columns)
+        else:
+            devices = pivot_device_series(encode_rows(rows))
+
+        results = []
+        for name in logical_device_names:
+            if name in invalid_names:
+                results.append({
+                    "logical_device_name": name,
+                    "reading_status": "validation_failed",
+                    "message": f'Logical device name "{name}" is invalid. Only alphanumeric characters are allowed.'
+                })
+            elif name in rejected:
+                results.append({
+                    "logical_device_name": name,
+                    "reading_status": "unsuccessful",
+                    "data": None,
+                    "message": rejected[name]
+                })
+            else:
+                results.append({
+                    "logical_device_name": name,
+                    "reading_status": "success" if name in devices else "unsuccessful",
+                    "data": devices.get(name)
+                })
+
+        # Log successful access
+        logger.info({"client_id": client_id, "action": "bulk_retrieve_readings_range", "layout": layout,
+                     "months": len(months), "rows": len(rows)})
+
+        response = {"months": months, "result": results}
+        if layout == 'pivot':
+            response["columns"] = pivot_columns
+        return response, 200
+
+    except DatabaseUnavailable as e:
+        logger.error({"client_id": client_id, "error": "Database unavailable", "exception": str(e)})
+        return service_unavailable(e)
+    except Exception as e:
+        logger.exception({"client_id": client_id, "error": "Unexpected error", "exception": str(e)})
+        return {'error': 'internal_server_error', 'message': str(e)}, 500
+
+
+@blueprint.route('/retrieve-readings-range', methods=['POST'])
+@validate_token_and_set_context
+@requires_scope("retrieve-readings")
+@requires_permission("read")
+def bulk_retrieve_readings_range():
+    client_id = getattr(g, 'token_info', {}).get('client_id', 'Unknown')
+    return json_response(*process_bulk_retrieve_readings_range(request.get_json(silent=True), client_id))
+
+
+def process_bulk_division_summary(data, client_id):
+    """Handle a division summary request body; returns (payload, status[, headers])."""
+    try:
+        if not isinstance(data, dict):
+            return {'error': 'invalid_request', 'message': 'Request body must be a JSON object.'}, 400
+
+        required_params = ['division_id', 'date']
+        missing_params = [param for param in required_params if param not in data]
+
+        if missing_params:
+            return {
+                'error': 'missing_parameters',
+                'message': f'Missing parameters: {", ".join(missing_params)}'
+            }, 400
+
+        division_id = data['division_id']
+        date = data['date']
+        top_n = data.get('top_n', 10)
+
+        # Validate division ID
+        valid, message = validate_division_id(division_id)
+        if not valid:
+            logger.warning({"client_id": client_id, "error": "Invalid division_id", "message": message})
+            return {'error': 'invalid_division_id', 'message': message}, 400
+
+        # Validate date
+        valid, message = validate_date(date)
+        if not valid:
+            logger.warning({"client_id": client_id, "error": "Invalid date", "message": message})
+            return {'error': 'invalid_date', 'message': message}, 400
+
+        if not isinstance(top_n, int) or not 0 < top_n <= MAX_TOP_N:
+            return {'error': 'invalid_top_n', 'message': f'top_n must be an integer between 1 and {MAX_TOP_N}.'}, 400
+
+        result = load_division_bulk_readings(division_id, date)
+        if isinstance(result, dict):
+            logger.error({"client_id": client_id, "error": "Error retrieving division readings", "exception": result['message']})
+            return result, 400 if result['error'] == 'invalid_input' else 500
+
+        meter_count, rows = result
+        summary = summarize_division(rows, top_n)
+
+        # Log successful access
+        logger.info({"client_id": client_id, "action": "bulk_division_summary", "division_id": division_id,
+                     "date": date, "meters_reporting": len(rows)})
+
+        return {
+            "division_id": division_id,
+            "date": date,
+            "meters": meter_count,
+            "meters_reporting": len(rows),
+            **summary
+        }, 200
+
+    except DatabaseUnavailable as e:
+        logger.error({"client_id": client_id, "error": "Database unavailable", "exception": str(e)})
+        return service_unavailable(e)
+    except Exception as e:
+        logger.exception({"client_id": client_id, "error": "Unexpected error", "exception": str(e)})
+        return {'error': 'internal_server_error', 'message': str(e)}, 500
+
+
+@blueprint.route('/division-summary', methods=['POST'])
+@validate_token_and_set_context
+@requires_scope("retrieve-readings")
+@requires_permission("read")
+def bulk_division_summary():
+    client_id = getattr(g, 'token_info', {}).get('client_id', 'Unknown')
+    return json_response(*process_bulk_division_summary(request.get_json(silent=True), client_id))
@@ -0,0 +1,72 @@
+import math
+from apps.startup import lazy_import
+
+np = lazy_import('numpy')
+
+# Energy registers totalled across the division
+TOTAL_COLUMNS = ('kwh_tot', 'kwh_r1', 'kwh_r2', 'kwh_r3', 'kwh_exp_tot', 'kvarh_tot', 'kvarh_exp_tot')
+TARIFF_COLUMNS = ('kwh_r1', 'kwh_r2', 'kwh_r3')
+DISTRIBUTION_COLUMNS = ('kwh_tot', 'max_dmnd')
+PERCENTILES = (50, 90, 95, 99)
+MAX_TOP_N = 100
+
+
+def _finite(value):
+    """Convert a NumPy scalar to a JSON-safe float (None for NaN)."""
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _column(rows, column):
+    return np.array([np.nan if row[column] is None else row[column] for row in rows], dtype=np.float64)
+
+
+def summarize_division(rows, top_n=10):
+    """Totals, tariff split, import/export balance, distributions and top-N max demand of snapshot rows."""
+    columns = {column: _column(rows, column) for column in set(TOTAL_COLUMNS + DISTRIBUTION_COLUMNS)}
+
+    totals = {column: _finite(np.nansum(columns[column])) for column in TOTAL_COLUMNS}
+
+    tariff_total = sum(totals[column] for column in TARIFF_COLUMNS)
+    tariff_split = {
+        column: (totals[column] / tariff_total if tariff_total else None)
+        for column in TARIFF_COLUMNS
+    }
+
+    import_export = {
+        "import_kwh": totals['kwh_tot'],
+        "export_kwh": totals['kwh_exp_tot'],
+        "net_kwh": totals['kwh_tot'] - totals['kwh_exp_tot'],
+        "exporting_meters": int(np.count_nonzero(columns['kwh_exp_tot'] > 0)),
+    }
+
+    distribution = {}
+    for column in DISTRIBUTION_COLUMNS:
+        values = columns[column][~np.isnan(columns[column])]
+        if not len(values):
+            distribution[column] = None
+            continue
+        stats = {"count": int(len(values)), "min": _finite(values.min()), "mean": _finite(values.mean()),
+                 "max": _finite(values.max())}
+        for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            stats[f"p{percentile}"] = _finite(value)
+        distribution[column] = stats
+
+    demand = np.where(np.isnan(columns['max_dmnd']), -np.inf, columns['max_dmnd'])
+    top = np.argsort(-demand, kind='stable')[:top_n]
+    top_max_demand = [
+        {
+            "logical_device_name": rows[i]['mtr_nbr'],
+            "max_dmnd": _finite(columns['max_dmnd'][i]),
+            "max_dmnd_Time": rows[i]['max_dmnd_Time'],
+        }
+        for i in top.tolist() if np.isfinite(demand[i])
+    ]
+
+    return {
+        "totals": totals,
+        "tariff_split": tariff_split,
+        "import_export": import_export,
+        "distribution": distribution,
+        "top_max_demand": top_max_demand,
+    }
@@ -28,4 +28,26 @@ def validate_date(date):
             return False, 'Date must be the first of the month (YYYY-MM-DD).'
     except ValueError:
         return False, 'Date must be in YYYY-MM-DD format.'
-    return True, None
\ No newline at end of file
+    return True, None
+
+MAX_RANGE_MONTHS = 12
+PIVOT_LAYOUTS = ('series', 'pivot')
+
+def validate_month_range(start_date, end_date):
+    for date in (start_date, end_date):
+        valid, message = validate_date(date)
+        if not valid:
+            return False, message
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    if start > end:
+        return False, 'Start date must not be after end date.'
+    months = (end.year - start.year) * 12 + (end.month - start.month) + 1
+    if months > MAX_RANGE_MONTHS:
+        return False, f'The maximum range is {MAX_RANGE_MONTHS} months.'
+    return True, None
+
+def validate_layout(layout):
+    if layout not in PIVOT_LAYOUTS:
+        return False, f'Layout must be one of {", ".join(PIVOT_LAYOUTS)}.'
+    return True, None
@@ -7,7 +7,29 @@ class Config(object):
     # Set up the App SECRET_KEY
     SECRET_KEY = os.getenv('SECRET_KEY', '9#99maLvMKk2T4*tghA7og$m')
 
-    HASH_ALGORITHM = 'HS256'
+    HASH_ALGORITHM = os.getenv('HASH_ALGORITHM', 'HS256')
+
+    # Access tokens: with an asymmetric HASH_ALGORITHM (RS256, ES256, ...) they are
+    # signed with the private key and verified with the public key, so API nodes
+    # need only the public one. TOKEN_VALIDATION_MODE 'database' checks every token
+    # against auth.db; 'stateless' trusts signature and claims, and checks token ids
+    # against the bloom filter and id list the issuing node publishes at
+    # REVOCATION_LIST_PATH
+    TOKEN_VALIDATION_MODE = os.getenv('TOKEN_VALIDATION_MODE', 'database')
+    JWT_PRIVATE_KEY_PATH = os.getenv('JWT_PRIVATE_KEY_PATH')
+    JWT_PUBLIC_KEY_PATH = os.getenv('JWT_PUBLIC_KEY_PATH')
+    REVOCATION_LIST_PATH = os.getenv('REVOCATION_LIST_PATH', os.path.join('Cache', 'revoked_tokens.bloom'))
+    REVOCATION_REFRESH_SECONDS = int(os.getenv('REVOCATION_REFRESH_SECONDS', 15))
+    REVOCATION_PUBLISH_DELAY_SECONDS = float(os.getenv('REVOCATION_PUBLISH_DELAY_SECONDS', 1.0))
+    REVOCATION_FALSE_POSITIVE_RATE = float(os.getenv('REVOCATION_FALSE_POSITIVE_RATE', 0.0001))
+
+    # Client secrets are stored as PBKDF2 hashes; successful verifications are
+    # remembered for CLIENT_SECRET_CACHE_TTL seconds so bursts of /token calls
+    # do not each pay for the key derivation
+    CLIENT_SECRET_HASH_ITERATIONS = int(os.getenv('CLIENT_SECRET_HASH_ITERATIONS', 100000))
+    CLIENT_SECRET_CACHE_TTL = int(os.getenv('CLIENT_SECRET_CACHE_TTL', 300))
+    CLIENT_SECRET_CACHE_SIZE = int(os.getenv('CLIENT_SECRET_CACHE_SIZE', 1024))
+
     # Assets Management
     ASSETS_ROOT = os.getenv('ASSETS_ROOT', '/static/assets')    
     
@@ -40,6 +62,67 @@ class Config(object):
         "database": "NCRE",
     }
     
+    # Read replicas per database name ('smart_meter', 'breakdown_assist', 'ncre'),
+    # each a list of connection param dicts shaped like the ones above
+    DATABASE_REPLICAS = {}
+
+    # Connection pooling, timeouts (seconds) and circuit breaker for the database router
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 10))
+    DATABASE_POOL_MAX_IDLE = int(os.getenv('DATABASE_POOL_MAX_IDLE', 300))
+    DATABASE_LOGIN_TIMEOUT = int(os.getenv('DATABASE_LOGIN_TIMEOUT', 5))
+    DATABASE_QUERY_TIMEOUT = int(os.getenv('DATABASE_QUERY_TIMEOUT', 30))
+    DATABASE_ACQUIRE_TIMEOUT = int(os.getenv('DATABASE_ACQUIRE_TIMEOUT', 5))
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+    CIRCUIT_BREAKER_RESET_SECONDS = int(os.getenv('CIRCUIT_BREAKER_RESET_SECONDS', 30))
+
+    # Query tracing: slow queries (and every query with QUERY_TRACE_LOG_ALL) go to
+    # Logs/db_queries.log; SLOW_QUERY_CAPTURE_PLANS adds their showplan to Logs/slow_query_plans.log,
+    # at most once per query shape every SLOW_QUERY_PLAN_COOLDOWN_SECONDS
+    QUERY_TRACE_ENABLED = (os.getenv('QUERY_TRACE_ENABLED', 'True') == 'True')
+    QUERY_TRACE_LOG_ALL = (os.getenv('QUERY_TRACE_LOG_ALL', 'False') == 'True')
+    SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', 1000))
+    SLOW_QUERY_CAPTURE_PLANS = (os.getenv('SLOW_QUERY_CAPTURE_PLANS', 'False') == 'True')
+    SLOW_QUERY_PLAN_COOLDOWN_SECONDS = int(os.getenv('SLOW_QUERY_PLAN_COOLDOWN_SECONDS', 600))
+
+    # Startup: which blueprints this worker serves, and whether to import the
+    # modules handlers otherwise load on first use (jwt, cryptography, numpy) up
+    # front, which pays off when a preforking server shares them with its workers
+    ENABLED_BLUEPRINTS = tuple(name.strip() for name in os.getenv(
+        'ENABLED_BLUEPRINTS', 'apiserver,bulkmetering,ordinarymetering,batch').split(',') if name.strip())
+    STARTUP_PRELOAD_IMPORTS = os.getenv('STARTUP_PRELOAD_IMPORTS', 'False') == 'True'
+
+    # Request profiling: a PROFILE_SAMPLE_RATE fraction of requests, plus any request whose
+    # X-Profile-Request header equals PROFILE_ADMIN_TOKEN, is stack-sampled into
+    # PROFILE_DIR, at most PROFILE_MAX_PER_MINUTE per worker. Off unless one of them is set.
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+    PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN')
+    PROFILE_MAX_PER_MINUTE = int(os.getenv('PROFILE_MAX_PER_MINUTE', 6))
+    PROFILE_INTERVAL_SECONDS = float(os.getenv('PROFILE_INTERVAL_SECONDS', 0.005))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('Logs', 'profiles'))
+
+    # Meter master index (LogicalDeviceName -> MeterId) refresh intervals, in seconds
+    METER_INDEX_REFRESH_SECONDS = int(os.getenv('METER_INDEX_REFRESH_SECONDS', 900))
+    METER_INDEX_MISS_REFRESH_SECONDS = int(os.getenv('METER_INDEX_MISS_REFRESH_SECONDS', 60))
+
+    # Local read-through store for recent MeterReading intervals
+    LOCAL_STORE_ENABLED = (os.getenv('LOCAL_STORE_ENABLED', 'True') == 'True')
+    LOCAL_STORE_PATH = os.getenv('LOCAL_STORE_PATH', os.path.join('Cache', 'interval_readings.db'))
+    LOCAL_STORE_MAX_BYTES = int(os.getenv('LOCAL_STORE_MAX_BYTES', 512 * 1024 * 1024))
+    # Overlap, on ServerDateTime, with the previous fetch for rows that committed late
+    LOCAL_STORE_REFETCH_SECONDS = int(os.getenv('LOCAL_STORE_REFETCH_SECONDS', 300))
+
+    # Batch endpoint: sub-requests per call and concurrent workers per process.
+    # Keep BATCH_MAX_WORKERS below DATABASE_POOL_SIZE.
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 20))
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 4))
+
+    # Response encoding of Decimal and datetime columns. The defaults match
+    # Flask's jsonify (Decimal as string, HTTP date format); set
+    # RESPONSE_DECIMAL_PLACES to round and RESPONSE_DATETIME_FORMAT='iso' for ISO 8601.
+    RESPONSE_DECIMAL_PLACES = int(os.environ['RESPONSE_DECIMAL_PLACES']) if os.getenv('RESPONSE_DECIMAL_PLACES') else None
+    RESPONSE_DECIMAL_AS_STRING = (os.getenv('RESPONSE_DECIMAL_AS_STRING', 'True') == 'True')
+    RESPONSE_DATETIME_FORMAT = os.getenv('RESPONSE_DATETIME_FORMAT', 'http')
+
     def print_debug_info(self):
         print("Config base directory:", self.basedir)
         print("Current working directory:", os.getcwd())
@@ -0,0 +1,327 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pymssql
+from apps.config import Config
+from apps.querytrace import (
+    CAPTURE_PLANS, PLAN_COOLDOWN_SECONDS, TRACE_ENABLED, PlanCaptureThrottle, QueryTrace, TracedCursor, log_plan,
+    plan_statement
+)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when a database backend is unhealthy, saturated or too slow; served as HTTP 503."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueryTimeout(DatabaseUnavailable):
+    """Raised when the driver abandons a query because it ran past its deadline."""
+
+
+# Driver errors that indicate an unhealthy backend rather than a bad query
+BACKEND_ERRORS = (pymssql.OperationalError, pymssql.InterfaceError)
+
+
+class CircuitBreaker:
+    """Fail fast after `failure_threshold` consecutive backend failures.
+
+    While open, calls are rejected until `reset_timeout` seconds have passed;
+    then a single trial call is let through (half-open) and its outcome closes
+    or re-opens the breaker.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(0, int(self.reset_timeout - (time.monotonic() - self._opened_at)) + 1)
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info("Circuit breaker for %s closed", self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                logging.error("Circuit breaker for %s opened after %d failures", self.name, self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another trial through when a half-open call ended without reaching the backend."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class ConnectionPool:
+    """Bounded pool of pymssql connections to a single server/database."""
+
+    def __init__(self, name, params, max_size, login_timeout, query_timeout, acquire_timeout, max_idle):
+        self.name = name
+        self.params = params
+        self.max_size = max_size
+        self.login_timeout = login_timeout
+        self.query_timeout = query_timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return pymssql.connect(
+            server=self.params['server'],
+            user=self.params['user'],
+            password=self.params['password'],
+            database=self.params['database'],
+            login_timeout=self.login_timeout,
+            timeout=self.query_timeout,
+            autocommit=True,
+        )
+
+    def _is_fresh(self, released_at):
+        return time.monotonic() - released_at <= self.max_idle
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            try:
+                conn, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+            if conn is not None:
+                if self._is_fresh(released_at):
+                    return conn
+                self._close(conn)
+                continue
+
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            # Pool is at capacity: wait for a connection to be released
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise queue.Empty
+                conn, released_at = self._idle.get(timeout=remaining)
+            except queue.Empty:
+                raise DatabaseUnavailable(f"Connection pool for {self.name} is exhausted.", retry_after=1)
+            if self._is_fresh(released_at):
+                return conn
+            self._close(conn)
+
+    def release(self, conn, discard=False):
+        if discard:
+            self._close(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+
+    def _close(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception as e:
+            logging.warning("Error closing connection to %s: %s", self.name, e)
+
+
+class DatabaseRouter:
+    """Routes queries to named databases, each with a primary and optional read replicas.
+
+    Every target has its own connection pool and circuit breaker. Read-only
+    queries prefer a healthy replica and fall back to the primary.
+    """
+
+    def __init__(self, databases, replicas=None, pool_size=10, login_timeout=5, query_timeout=30,
+                 acquire_timeout=5, max_idle=300, failure_threshold=5, reset_timeout=30):
+        self._targets = {}
+        self._replicas = {}
+        self._round_robin = {}
+        # Showplans are captured one at a time, off the request path, and
+        # never while the backend's breaker is open
+        self._plan_throttle = PlanCaptureThrottle(PLAN_COOLDOWN_SECONDS)
+        self._plan_executor = None
+        self._plan_executor_lock = threading.Lock()
+
+        def make_target(target_name, params):
+            pool = ConnectionPool(target_name, params, pool_size, login_timeout, query_timeout,
+                                  acquire_timeout, max_idle)
+            return pool, CircuitBreaker(target_name, failure_threshold, reset_timeout)
+
+        for name, params in databases.items():
+            self._targets[name] = make_target(name, params)
+            self._replicas[name] = [
+                make_target(f"{name}-replica-{i}", replica_params)
+                for i, replica_params in enumerate((replicas or {}).get(name) or [], start=1)
+            ]
+            self._round_robin[name] = itertools.cycle(range(len(self._replicas[name]) or 1))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            databases={
+                'smart_meter': config.SMART_METER_CONNECTION_PARAMS,
+                'breakdown_assist': config.BREAKDOWN_ASSIST_CONNECTION_PARAMS,
+                'ncre': config.NCRE_CONNECTION_PARAMS,
+            },
+            replicas=config.DATABASE_REPLICAS,
+            pool_size=config.DATABASE_POOL_SIZE,
+            login_timeout=config.DATABASE_LOGIN_TIMEOUT,
+            query_timeout=config.DATABASE_QUERY_TIMEOUT,
+            acquire_timeout=config.DATABASE_ACQUIRE_TIMEOUT,
+            max_idle=config.DATABASE_POOL_MAX_IDLE,
+            failure_threshold=config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=config.CIRCUIT_BREAKER_RESET_SECONDS,
+        )
+
+    def _select_target(self, name, read_only):
+        if name not in self._targets:
+            raise KeyError(f"Unknown database: {name}")
+        replicas = self._replicas[name]
+        if read_only and replicas:
+            start = next(self._round_robin[name])
+            for offset in range(len(replicas)):
+                pool, breaker = replicas[(start + offset) % len(replicas)]
+                if breaker.allow():
+                    return pool, breaker
+        pool, breaker = self._targets[name]
+        if not breaker.allow():
+            raise DatabaseUnavailable(f"Database {name} is unavailable.", retry_after=breaker.retry_after())
+        return pool, breaker
+
+    @contextmanager
+    def cursor(self, name='smart_meter', read_only=True, timeout=None, as_dict=True):
+        """Yield a cursor on database `name`; the driver abandons a query after `timeout` seconds.
+
+        Connections are opened with the default query timeout, which DB-Lib
+        enforces itself; a different per-call `timeout` is set on the
+        connection for the duration of this cursor.
+        """
+        pool, breaker = self._select_target(name, read_only)
+        acquire_started = time.perf_counter()
+        try:
+            conn = pool.acquire()
+        except DatabaseUnavailable:
+            breaker.record_failure()
+            raise
+        except BACKEND_ERRORS as e:
+            breaker.record_failure()
+            raise DatabaseUnavailable(f"Could not connect to {pool.name}: {e}",
+                                      retry_after=breaker.retry_after()) from e
+
+        deadline = timeout or pool.query_timeout
+        if deadline != pool.query_timeout:
+            conn._conn.query_timeout = deadline
+        discard = False
+        started = time.perf_counter()
+        trace = QueryTrace(pool.name, time.perf_counter() - acquire_started) if TRACE_ENABLED else None
+        try:
+            with conn.cursor(as_dict=as_dict) as cursor:
+                yield TracedCursor(cursor, trace) if trace else cursor
+            breaker.record_success()
+        except BACKEND_ERRORS as e:
+            discard = True
+            breaker.record_failure()
+            if time.perf_counter() - started >= deadline:
+                raise QueryTimeout(f"Query on {pool.name} exceeded its deadline.",
+                                   retry_after=breaker.retry_after()) from e
+            raise DatabaseUnavailable(f"Database {pool.name} failed: {e}",
+                                      retry_after=breaker.retry_after()) from e
+        except pymssql.Error:
+            # The backend answered (e.g. a bad query), so it is healthy
+            discard = True
+            breaker.record_success()
+            raise
+        except BaseException:
+            discard = True
+            breaker.release_trial()
+            raise
+        finally:
+            if not discard and deadline != pool.query_timeout:
+                conn._conn.query_timeout = pool.query_timeout
+            pool.release(conn, discard=discard)
+            if trace:
+                trace.record()
+                if CAPTURE_PLANS and trace.is_slow and not trace.error:
+                    self._schedule_plan_capture(pool, breaker, trace)
+
+    def _schedule_plan_capture(self, pool, breaker, trace):
+        if breaker.is_open or not self._plan_throttle.admit(trace):
+            return
+        with self._plan_executor_lock:
+            if self._plan_executor is None:
+                self._plan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='showplan-capture')
+        self._plan_executor.submit(self._capture_plan, pool, breaker, trace)
+
+    def _capture_plan(self, pool, breaker, trace):
+        """Log the estimated plan of a slow query; SHOWPLAN_XML compiles the query without running it."""
+        if breaker.is_open:
+            return
+        try:
+            conn = pool.acquire()
+        except Exception as e:
+            logging.warning("Could not capture plan on %s: %s", pool.name, e)
+            return
+        discard = False
+        try:
+            # Never inline the values: SHOWPLAN_XML echoes the statement back in the logged plan
+            statement = plan_statement(trace.query, trace.params)
+            with conn.cursor() as cursor:
+                cursor.execute('SET SHOWPLAN_XML ON')
+                try:
+                    cursor.execute(statement)
+                    plan = ''.join(row[0] for row in cursor.fetchall())
+                finally:
+                    cursor.execute('SET SHOWPLAN_XML OFF')
+            log_plan(trace, plan)
+        except Exception as e:
+            discard = True
+            logging.warning("Could not capture plan on %s: %s", pool.name, e)
+        finally:
+            pool.release(conn, discard=discard)
+
+
+db_router = DatabaseRouter.from_config(Config)
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+from apps.config import Config
+from apps.db import db_router
+
+REFRESH_INTERVAL = Config.METER_INDEX_REFRESH_SECONDS
+MISS_REFRESH_INTERVAL = Config.METER_INDEX_MISS_REFRESH_SECONDS
+
+# Asset type of bulk (billing) meters in MeterAssignment
+BULK_ASSET_TYPE_ID = 2
+
+MeterRef = namedtuple('MeterRef', ['name', 'meter_id', 'division_id', 'division_key', 'asset_type_ids'])
+
+def _key(value):
+    """Lookup key for names and division ids, matching the database's case-insensitive collation."""
+    return str(value).strip().casefold()
+
+def load_meter_master():
+    """Fetch every meter with its division and assigned asset types, keyed by normalised LogicalDeviceName."""
+    query = """
+        SELECT mm.LogicalDeviceName, mm.MeterId, mm.DivisionId, ma.AssetTypeId
+        FROM MeterMaster mm
+        LEFT JOIN MeterAssignment ma ON ma.MeterId = mm.MeterId;
+        """
+    with db_router.cursor('smart_meter', as_dict=False) as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+
+    asset_types = {}
+    for name, meter_id, division_id, asset_type_id in rows:
+        key = (name, meter_id, division_id)
+        asset_types.setdefault(key, set())
+        if asset_type_id is not None:
+            asset_types[key].add(asset_type_id)
+
+    by_name = {}
+    for (name, meter_id, division_id), types in asset_types.items():
+        by_name.setdefault(_key(name), []).append(
+            MeterRef(name, meter_id, division_id, _key(division_id), frozenset(types)))
+    return by_name
+
+class MeterIndex:
+    """In-process LogicalDeviceName -> MeterRef index of the meter master data.
+
+    The index is loaded on first use and refreshed in the background once it is
+    older than `refresh_interval`; stale data keeps being served meanwhile.
+    Lookups of unknown names force a reload at most once per
+    `miss_refresh_interval`, so newly commissioned meters are picked up quickly
+    without letting typos hit the database on every request. Only one load runs
+    at a time: requests wait for the initial load, but a miss reload already
+    in progress is not waited for; those requests answer from the current index.
+    Names and division ids are matched case-insensitively, ignoring surrounding
+    whitespace, like the SQL joins this index replaces.
+    """
+
+    def __init__(self, loader=load_meter_master, refresh_interval=REFRESH_INTERVAL,
+                 miss_refresh_interval=MISS_REFRESH_INTERVAL):
+        self._loader = loader
+        self._refresh_interval = refresh_interval
+        self._miss_refresh_interval = miss_refresh_interval
+        self._by_name = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self):
+        """Reload the index synchronously."""
+        by_name = self._loader()
+        with self._lock:
+            self._by_name = by_name
+            self._loaded_at = time.monotonic()
+        logging.info("Meter index refreshed with %d logical device names", len(by_name))
+
+    def _age(self):
+        return time.monotonic() - self._loaded_at if self._by_name is not None else float('inf')
+
+    def _reload(self, max_age, wait=True):
+        """Reload unless the index is younger than `max_age`; returns False if another load was running.
+
+        Threads that waited for a load in progress see the fresh index and skip
+        their own, so at most one full scan runs at a time.
+        """
+        if not self._load_lock.acquire(blocking=wait):
+            return False
+        try:
+            if self._age() >= max_age:
+                self.refresh()
+            return True
+        finally:
+            self._load_lock.release()
+
+    def _refresh_in_background(self):
+        try:
+            self._reload(self._refresh_interval)
+        except Exception as e:
+            logging.error("Meter index refresh failed, serving stale data: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_loaded(self):
+        if self._by_name is None:
+            self._reload(float('inf'))
+            return
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._loaded_at < self._refresh_interval:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name='meter-index-refresh', daemon=True).start()
+
+    def _lookup(self, names, division_id, asset_type_id):
+        resolved, rejected = {}, {}
+        division_key = _key(division_id)
+        for name in names:
+            refs = self._by_name.get(_key(name))
+            if not refs:
+                rejected[name] = f'Logical device name "{name}" is not a known meter.'
+                continue
+            refs = [ref for ref in refs if ref.division_key == division_key]
+            if not refs:
+                rejected[name] = f'Logical device name "{name}" does not belong to division {division_id}.'
+                continue
+            if asset_type_id is not None:
+                refs = [ref for ref in refs if asset_type_id in ref.asset_type_ids]
+                if not refs:
+                    rejected[name] = f'Logical device name "{name}" is not assigned asset type {asset_type_id}.'
+                    continue
+            resolved[name] = refs
+        return resolved, rejected
+
+    def meters_in_division(self, division_id: str, asset_type_id=None) -> Dict[str, List[MeterRef]]:
+        """All meters of `division_id` (restricted to `asset_type_id`, if given), keyed by name."""
+        self._ensure_loaded()
+        division_key = _key(division_id)
+        names = [refs[0].name for refs in self._by_name.values()
+                 if any(ref.division_key == division_key for ref in refs)]
+        resolved, _ = self._lookup(names, division_id, asset_type_id)
+        return resolved
+
+    def resolve(self, names: List[str], division_id: str, asset_type_id=None) -> Tuple[Dict[str, List[MeterRef]], Dict[str, str]]:
+        """Split `names` into meters of `division_id` (and `asset_type_id`, if given) and rejections.
+
+        Returns (resolved, rejected): resolved maps name -> list of MeterRef,
+        rejected maps name -> human readable reason.
+        """
+        self._ensure_loaded()
+        resolved, rejected = self._lookup(names, division_id, asset_type_id)
+
+        if rejected and self._age() >= self._miss_refresh_interval:
+            try:
+                if not self._reload(self._miss_refresh_interval, wait=False):
+                    return resolved, rejected
+            except Exception as e:
+                logging.error("Meter index refresh failed, serving stale data: %s", e)
+                return resolved, rejected
+            resolved, rejected = self._lookup(names, division_id, asset_type_id)
+        return resolved, rejected
+
+meter_index = MeterIndex()
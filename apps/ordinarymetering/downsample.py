@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from apps.startup import lazy_import
+
+np = lazy_import('numpy')
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+MIN_POINTS = 3
+MAX_POINTS = 10000
+DEFAULT_COLUMNS = ['ActivePowerPluse']
+
+
+def numeric_columns(columns):
+    """The columns that can be downsampled; the *Time* columns hold datetimes, not readings."""
+    return [column for column in columns if 'Time' not in column]
+
+
+def validate_downsample(options, allowed_columns):
+    if not isinstance(options, dict):
+        return False, 'downsample must be an object with points, method and columns.'
+    points = options.get('points')
+    if not isinstance(points, int) or not MIN_POINTS <= points <= MAX_POINTS:
+        return False, f'downsample.points must be an integer between {MIN_POINTS} and {MAX_POINTS}.'
+    if options.get('method', 'lttb') not in DOWNSAMPLE_METHODS:
+        return False, f'downsample.method must be one of {", ".join(DOWNSAMPLE_METHODS)}.'
+    columns = options.get('columns', DEFAULT_COLUMNS)
+    if not isinstance(columns, list) or not columns or any(column not in allowed_columns for column in columns):
+        return False, 'downsample.columns must be a non-empty list of served numeric reading columns.'
+    return True, None
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of the `n_out` points that best keep the shape of y(x).
+
+    Bucket edges and the bucket averages used as the third triangle vertex
+    are computed in one vectorised pass; only the choice of one point per
+    bucket, which depends on the previous choice, loops over buckets.
+    """
+    n = len(x)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Min-max envelope: the minimum and maximum of each of `n_out // 2` equal buckets, in order."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    size = -(-n // (n_out // 2))
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    mins = np.where(np.isnan(padded), np.inf, padded).argmin(axis=1) + offsets
+    maxs = np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1) + offsets
+    return np.unique(np.concatenate((mins, maxs)))
+
+
+def downsample_series(rows, columns, points, method='lttb'):
+    """Reduce each column of `rows` (ordered by DateTime) to at most `points` points.
+
+    Returns {column: {"DateTime": [...], "values": [...]}}; null readings are
+    dropped before downsampling.
+    """
+    timestamps = np.array([row['DateTime'] for row in rows], dtype='datetime64[ms]').astype(np.float64)
+    series = {}
+    for column in columns:
+        values = np.array([np.nan if row[column] is None else row[column] for row in rows], dtype=np.float64)
+        present = np.flatnonzero(~np.isnan(values))
+        x, y = timestamps[present], values[present]
+        if method == 'minmax':
+            picked = minmax_indices(y, points)
+        else:
+            picked = lttb_indices(x, y, points)
+        source = present[picked]
+        series[column] = {
+            "DateTime": [rows[i]['DateTime'] for i in source.tolist()],
+            "values": y[picked].tolist(),
+        }
+    return series
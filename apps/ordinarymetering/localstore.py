@@ -0,0 +1,212 @@
+import datetime
+import decimal
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from apps.config import Config
+
+STORE_PATH = Config.LOCAL_STORE_PATH
+STORE_MAX_BYTES = Config.LOCAL_STORE_MAX_BYTES
+REFETCH_SECONDS = Config.LOCAL_STORE_REFETCH_SECONDS
+
+# Fixed-width text keys keep DateTime ordering correct in SQLite
+KEY_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Bump when the table layout changes; an older store file is cleared on open
+SCHEMA_VERSION = 2
+
+# Evict down to this fraction of the size limit so eviction does not run on every write
+EVICTION_TARGET = 0.8
+
+
+def _encode_value(value):
+    if isinstance(value, decimal.Decimal):
+        return {'$dec': str(value)}
+    if isinstance(value, datetime.datetime):
+        return {'$dt': value.strftime(KEY_FORMAT)}
+    raise TypeError(f"Object of type {type(value).__name__} is not storable")
+
+
+def _decode_value(obj):
+    if '$dec' in obj:
+        return decimal.Decimal(obj['$dec'])
+    if '$dt' in obj:
+        return datetime.datetime.strptime(obj['$dt'], KEY_FORMAT)
+    return obj
+
+
+def _parse_key(key):
+    return datetime.datetime.strptime(key, KEY_FORMAT)
+
+
+def encode_row(row):
+    return json.dumps(row, default=_encode_value, separators=(',', ':'))
+
+
+def decode_row(payload):
+    return json.loads(payload, object_hook=_decode_value)
+
+
+class IntervalReadingStore:
+    """On-disk read-through store of MeterReading rows, one coverage record per meter.
+
+    For each meter the store remembers the DateTime range it covers
+    (`covered_from` to `covered_to`) and the newest ServerDateTime among the
+    rows it holds (the high-water mark). A request inside the coverage only
+    fetches the rows inserted into it since the high-water mark, minus
+    `refetch_seconds` for rows that were still being committed, so backfilled
+    and out-of-order readings are picked up as well. A window reaching past
+    either end of the coverage also fetches the missing part and extends it.
+    Everything else is served from the local file.
+    All remote fetches run before the local write transaction, so a slow query
+    never holds up other workers writing to the store.
+    When the file grows past `max_bytes` the least recently used meters are
+    evicted.
+    """
+
+    def __init__(self, path=STORE_PATH, max_bytes=STORE_MAX_BYTES, refetch_seconds=REFETCH_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.refetch = datetime.timedelta(seconds=refetch_seconds)
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            # The store is only a cache: a file in an older layout is cleared, not migrated
+            conn.executescript('''
+                DROP TABLE IF EXISTS meters;
+                DROP TABLE IF EXISTS readings;
+            ''')
+        conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS meters (
+                meter_id INTEGER PRIMARY KEY,
+                covered_from TEXT NOT NULL,
+                covered_to TEXT NOT NULL,
+                high_water TEXT,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS readings (
+                meter_id INTEGER NOT NULL,
+                date_time TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (meter_id, date_time)
+            ) WITHOUT ROWID;
+            PRAGMA user_version = {SCHEMA_VERSION};
+        ''')
+        self._initialized = True
+
+    def read(self, meter_id, start, end, fetch, fetch_changes):
+        """Return the rows of `meter_id` with start <= DateTime <= end, ordered by DateTime.
+
+        `fetch(lower, upper)` loads the rows with lower <= DateTime <= upper
+        from the central database, and `fetch_changes(since, lower, upper)`
+        only those of them with ServerDateTime > since. Each row must carry its
+        `DateTime` and `ServerDateTime`; the latter is not returned.
+        """
+        conn = self._connect()
+        try:
+            state = self._state(conn, meter_id)
+            reset, covered_from, covered_to, rows = self._fetch_missing(state, start, end, fetch, fetch_changes)
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if not reset and self._state(conn, meter_id) != state:
+                    # Another worker replaced this meter's coverage while we were fetching
+                    rows = None
+                else:
+                    self._store(conn, meter_id, rows, covered_from, covered_to, reset)
+                    self._evict(conn, keep=meter_id)
+                    payloads = conn.execute('''
+                        SELECT payload FROM readings
+                        WHERE meter_id = ? AND date_time >= ? AND date_time <= ?
+                        ORDER BY date_time
+                    ''', (meter_id, start.strftime(KEY_FORMAT), end.strftime(KEY_FORMAT))).fetchall()
+        finally:
+            conn.close()
+        if rows is None:
+            rows = fetch(start, end)
+            for row in rows:
+                row.pop('ServerDateTime', None)
+            return rows
+        return [decode_row(payload) for (payload,) in payloads]
+
+    @staticmethod
+    def _state(conn, meter_id):
+        return conn.execute(
+            'SELECT covered_from, covered_to, high_water FROM meters WHERE meter_id = ?', (meter_id,)
+        ).fetchone()
+
+    def _fetch_missing(self, state, start, end, fetch, fetch_changes):
+        """Fetch what the store lacks for the window; returns (reset, covered_from, covered_to, rows)."""
+        start_key, end_key = start.strftime(KEY_FORMAT), end.strftime(KEY_FORMAT)
+        if state is None or start_key > state[1]:
+            # No usable coverage: load the whole window and start over from it
+            return True, start_key, end_key, fetch(start, end)
+
+        covered_from, covered_to, high_water = state
+        if high_water is None:
+            # Nothing stored yet, so there is no watermark to fetch changes from
+            rows = fetch(_parse_key(covered_from), _parse_key(covered_to))
+        else:
+            rows = fetch_changes(_parse_key(high_water) - self.refetch, _parse_key(covered_from), _parse_key(covered_to))
+        if start_key < covered_from:
+            rows.extend(fetch(start, _parse_key(covered_from)))
+            covered_from = start_key
+        if end_key > covered_to:
+            rows.extend(fetch(_parse_key(covered_to), end))
+            covered_to = end_key
+        return False, covered_from, covered_to, rows
+
+    def _store(self, conn, meter_id, rows, covered_from, covered_to, reset):
+        if reset:
+            conn.execute('DELETE FROM readings WHERE meter_id = ?', (meter_id,))
+            conn.execute('DELETE FROM meters WHERE meter_id = ?', (meter_id,))
+        server_times = [row.pop('ServerDateTime', None) for row in rows]
+        conn.executemany(
+            'INSERT OR REPLACE INTO readings (meter_id, date_time, payload) VALUES (?, ?, ?)',
+            [(meter_id, row['DateTime'].strftime(KEY_FORMAT), encode_row(row)) for row in rows]
+        )
+        state = self._state(conn, meter_id)
+        marks = [value.strftime(KEY_FORMAT) for value in server_times if value is not None]
+        if state is not None and state[2] is not None:
+            marks.append(state[2])
+        conn.execute('''
+            INSERT OR REPLACE INTO meters (meter_id, covered_from, covered_to, high_water, last_access)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (meter_id, covered_from, covered_to, max(marks, default=None), time.time()))
+
+    def _used_bytes(self, conn):
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def _evict(self, conn, keep):
+        if self._used_bytes(conn) <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICTION_TARGET
+        victims = conn.execute(
+            'SELECT meter_id FROM meters WHERE meter_id != ? ORDER BY last_access', (keep,)
+        ).fetchall()
+        evicted = 0
+        for (victim,) in victims:
+            conn.execute('DELETE FROM readings WHERE meter_id = ?', (victim,))
+            conn.execute('DELETE FROM meters WHERE meter_id = ?', (victim,))
+            evicted += 1
+            if self._used_bytes(conn) <= target:
+                break
+        logging.info("Local reading store evicted %d meters", evicted)
+
+
+interval_store = IntervalReadingStore() if Config.LOCAL_STORE_ENABLED else None
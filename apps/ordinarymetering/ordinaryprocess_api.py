@@ -1,8 +1,12 @@
-import pymssql
 from apps.config import Config
+from apps.db import db_router, DatabaseUnavailable
+from apps.meterindex import meter_index
+from apps.ordinarymetering.localstore import interval_store
 from typing import List, Dict
-from datetime import datetime 
+from datetime import datetime, time
+from functools import partial
 import logging
+import sqlite3
 import os
 import json
 
@@ -10,28 +14,6 @@ import json
 log_dir = os.path.join(os.getcwd(), 'Logs')
 log_file = os.path.join(log_dir, 'app.log')
 
-# Database configuration
-SMART_METER_CONNECTION_PARAMS = Config.SMART_METER_CONNECTION_PARAMS
-BREAKDOWN_ASSIST_CONNECTION_PARAMS = Config.BREAKDOWN_ASSIST_CONNECTION_PARAMS
-
-def get_db_connection():
-    return pymssql.connect(
-        server=SMART_METER_CONNECTION_PARAMS['server'],
-        user=SMART_METER_CONNECTION_PARAMS['user'],
-        password=SMART_METER_CONNECTION_PARAMS['password'],
-        database=SMART_METER_CONNECTION_PARAMS['database'],
-    )
-    
-def get_db_connection_BA():
-    return pymssql.connect(
-        server=BREAKDOWN_ASSIST_CONNECTION_PARAMS['server'],
-        user=BREAKDOWN_ASSIST_CONNECTION_PARAMS['user'],
-        password=BREAKDOWN_ASSIST_CONNECTION_PARAMS['password'],
-        database=BREAKDOWN_ASSIST_CONNECTION_PARAMS['database'],
-    )
-
-
-
 # Define or adapt this class based on the new result structure
 class Customer:
     def __init__(self, Name = None, Address = None, AreaID = None):
@@ -72,6 +54,25 @@ def validate_date_range(start_date: str, end_date: str):
 
 
 
+# Columns served by the readings endpoint, read once at import
+READINGS_COLUMNS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve_meter_readings.json')
+
+def load_metering_related_columns():
+    with open(READINGS_COLUMNS_FILE, 'r') as f:
+        return json.load(f)['MeteringRelated']
+
+try:
+    METERING_RELATED_COLUMNS = load_metering_related_columns()
+except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+    logging.error("Error reading JSON file: %s", e)
+    METERING_RELATED_COLUMNS = None
+
+# Sync only returns rows whose ServerDateTime is at least this old (by the
+# database clock), so rows still being committed with an earlier timestamp
+# are not skipped once the watermark has moved past them
+SYNC_SAFETY_LAG_SECONDS = 120
+
+
 def load_meter_by_logical_device_number(logical_device_name: str, divisionID: str, start_date: str, end_date: str):
     # Convert date strings to a suitable format
     try:
@@ -81,34 +82,141 @@ def load_meter_by_logical_device_number(logical_device_name: str, divisionID: st
         logging.error("Date format error: %s", ve)
         return {'error': 'invalid_date_format', 'message': str(ve)}
 
-    # Load metering related columns from JSON file
+    if METERING_RELATED_COLUMNS is None:
+        return {'error': 'json_error', 'message': f'Could not load columns from {READINGS_COLUMNS_FILE}'}
+
+    # Resolve the meter in-process; unknown or wrong-division meters never reach the DB
+    try:
+        resolved, rejected = meter_index.resolve([logical_device_name], divisionID)
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logging.error("Error resolving meter: %s", e)
+        return {'error': 'database_error', 'message': str(e)}
+    if rejected:
+        return {'error': 'unknown_meter', 'message': rejected[logical_device_name]}
+    meter_ids = [ref.meter_id for ref in resolved[logical_device_name]]
+
+    window_start = datetime.combine(start_date, time.min)
+    window_end = datetime.combine(end_date, time.min)
     try:
-        with open('apps/apis/serve_meter_readings.json', 'r') as f:
-            json_data = json.load(f)
-            metering_related_columns = json_data['MeteringRelated']
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logging.error("Error reading JSON file: %s", e)
-        return {'error': 'json_error', 'message': str(e)}
+        result = []
+        for meter_id in meter_ids:
+            fetch = partial(fetch_interval_readings, meter_id)
+            if interval_store is not None:
+                try:
+                    result.extend(interval_store.read(meter_id, window_start, window_end, fetch,
+                                                      partial(fetch_interval_changes, meter_id)))
+                    continue
+                except sqlite3.Error as e:
+                    logging.error("Local reading store error, reading from the database: %s", e)
+            for row in fetch(window_start, window_end):
+                del row['ServerDateTime']
+                result.append(row)
+        if len(meter_ids) > 1:
+            result.sort(key=lambda row: row['DateTime'])
+        return result  # Return results list, even if empty
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logging.error("Error executing query: %s", e)
+        return {'error': 'database_error', 'message': str(e)}  # Return error message as a dictionary
+
+
+def fetch_interval_readings(meter_id: int, lower: datetime, upper: datetime):
+    """Load the MeterReading rows of one meter with lower <= DateTime <= upper, ordered by DateTime.
 
+    Rows also carry ServerDateTime, which the local store keeps as its watermark.
+    """
     # Construct the SQL SELECT statement with only metering-related columns
-    selected_columns = ', '.join(metering_related_columns)
-    
+    selected_columns = ', '.join(
+        f'mr.{column}' for column in ['DateTime', 'ServerDateTime'] + METERING_RELATED_COLUMNS
+    )
+
     query = f"""
             SELECT {selected_columns}
             FROM MeterReading mr
-            JOIN MeterMaster mm ON mr.MeterId = mm.MeterId 
-            WHERE mm.LogicalDeviceName = %s
-            AND mm.DivisionID = %s
-            AND mr.DateTime BETWEEN %s AND %s;
+            WHERE mr.MeterId = %s
+            AND mr.DateTime BETWEEN %s AND %s
+            ORDER BY mr.DateTime;
+            """
+    with db_router.cursor('smart_meter') as cursor:
+        cursor.execute(query, (meter_id, lower, upper))
+        return cursor.fetchall()
+
+
+def fetch_interval_changes(meter_id: int, since: datetime, lower: datetime, upper: datetime):
+    """Like fetch_interval_readings, limited to rows inserted after `since` (by ServerDateTime)."""
+    selected_columns = ', '.join(
+        f'mr.{column}' for column in ['DateTime', 'ServerDateTime'] + METERING_RELATED_COLUMNS
+    )
+
+    query = f"""
+            SELECT {selected_columns}
+            FROM MeterReading mr
+            WHERE mr.MeterId = %s
+            AND mr.ServerDateTime > %s
+            AND mr.DateTime BETWEEN %s AND %s
+            ORDER BY mr.DateTime;
+            """
+    with db_router.cursor('smart_meter') as cursor:
+        cursor.execute(query, (meter_id, since, lower, upper))
+        return cursor.fetchall()
+
+
+def load_meter_changes_since(watermarks: Dict[str, datetime], divisionID: str, limit: int):
+    """Load MeterReading rows inserted after each meter's ServerDateTime watermark.
+
+    Returns (rows, new_watermarks, has_more). Rows are ordered by ServerDateTime;
+    TOP ... WITH TIES keeps rows sharing the last ServerDateTime on the same
+    page, and rows younger than SYNC_SAFETY_LAG_SECONDS are left for a later
+    call, so advancing the watermark does not skip late-committing rows.
+    """
+    if METERING_RELATED_COLUMNS is None:
+        return {'error': 'json_error', 'message': f'Could not load columns from {READINGS_COLUMNS_FILE}'}
+
+    try:
+        resolved, rejected = meter_index.resolve(list(watermarks), divisionID)
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logging.error("Error resolving meters: %s", e)
+        return {'error': 'database_error', 'message': str(e)}
+    if rejected:
+        return {'error': 'unknown_meter', 'message': ' '.join(rejected.values())}
+
+    names_by_meter_id = {ref.meter_id: name for name, refs in resolved.items() for ref in refs}
+    predicates = ' OR '.join(['(mr.MeterId = %s AND mr.ServerDateTime > %s)'] * len(names_by_meter_id))
+    params = [limit]
+    for meter_id, name in names_by_meter_id.items():
+        params.extend((meter_id, watermarks[name]))
+    params.append(SYNC_SAFETY_LAG_SECONDS)
+
+    selected_columns = ', '.join(
+        f'mr.{column}' for column in ['MeterId', 'DateTime', 'ServerDateTime'] + METERING_RELATED_COLUMNS
+    )
+    query = f"""
+            SELECT TOP (%s) WITH TIES {selected_columns}
+            FROM MeterReading mr
+            WHERE ({predicates})
+            AND mr.ServerDateTime <= DATEADD(SECOND, -%s, GETDATE())
+            ORDER BY mr.ServerDateTime;
             """
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(as_dict=True) as cursor:
-                cursor.execute(query, (logical_device_name, divisionID, start_date, end_date))
-                result = cursor.fetchall()  # Use fetchall to get all results
-                return result  # Return results list, even if empty
+        with db_router.cursor('smart_meter') as cursor:
+            cursor.execute(query, tuple(params))
+            rows = cursor.fetchall()
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logging.error("Error executing query: %s", e)
-        return {'error': 'database_error', 'message': str(e)}  # Return error message as a dictionary
-
-
+        return {'error': 'database_error', 'message': str(e)}
+
+    new_watermarks = dict(watermarks)
+    result = []
+    for row in rows:
+        name = names_by_meter_id[row.pop('MeterId')]
+        if row['ServerDateTime'] > new_watermarks[name]:
+            new_watermarks[name] = row['ServerDateTime']
+        result.append({'logical_device_name': name, **row})
+    return result, new_watermarks, len(rows) >= limit
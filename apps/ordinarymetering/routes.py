@@ -1,24 +1,39 @@
 # Standard Library Imports
 import logging
+from datetime import datetime, timedelta
 from functools import wraps
 
 # Third-Party Library Imports
-from flask import request, jsonify
+from flask import request
 from ratelimit import limits, RateLimitException
 from backoff import on_exception, expo
 
 # Local Application/Library Imports
 from . import blueprint
-from .ordinaryprocess_api import load_meter_by_logical_device_number, validate_date_range
+from apps.db import DatabaseUnavailable
+from apps.apiserver.decorators import service_unavailable
+from apps.serializers import encode_rows, json_response
+from apps.apiserver.decorators import requires_permission, requires_scope, validate_token_and_set_context
+from apps.bulkmetering.util import validate_logical_device_names
+from .downsample import DEFAULT_COLUMNS, downsample_series, numeric_columns, validate_downsample
+from .ordinaryprocess_api import (
+    METERING_RELATED_COLUMNS, load_meter_by_logical_device_number, load_meter_changes_since, validate_date_range
+)
+from .synccursor import InvalidCursor, decode_cursor, encode_cursor
 
+# Page size of the sync endpoint
+DEFAULT_SYNC_LIMIT = 5000
+MAX_SYNC_LIMIT = 20000
+# How far back a first sync (without a cursor) may start
+MAX_SYNC_LOOKBACK_DAYS = 40
 
-@on_exception(expo, RateLimitException, max_tries=3)
-@limits(calls=10, period=60)  # 10 requests per minute
-@blueprint.route('/retrieve-readings', methods=['POST'])
-def secure_data():
+
+def process_retrieve_readings(data, client_id=None):
+    """Handle a readings request body; returns (payload, status[, headers])."""
     try:
-        # Parse JSON body
-        data = request.get_json()
+        if not isinstance(data, dict):
+            return {'error': 'invalid_request', 'message': 'Request body must be a JSON object.'}, 400
+
         logical_device_name = data.get('logical_device_name')
         divisionID = data.get('divisionID')
         start_date = data.get('start_date')
@@ -28,7 +43,7 @@ def secure_data():
         date_validation_result = validate_date_range(start_date, end_date)
         if date_validation_result:
             logging.warning(date_validation_result['message'])
-            return jsonify(date_validation_result), 400
+            return date_validation_result, 400
 
         # Check for missing parameters
         missing_params = [
@@ -37,21 +52,140 @@ def secure_data():
         ]
         if missing_params:
             logging.warning(f"Missing parameters: {', '.join(missing_params)}")
-            return jsonify({
+            return {
                 'error': 'missing_parameters',
                 'message': f'Missing parameters: {", ".join(missing_params)}'
-            }), 400
+            }, 400
+
+        # Validate optional chart downsampling
+        downsample = data.get('downsample')
+        if downsample is not None:
+            valid, message = validate_downsample(downsample, numeric_columns(METERING_RELATED_COLUMNS or []))
+            if not valid:
+                logging.warning(message)
+                return {'error': 'invalid_downsample', 'message': message}, 400
 
         # Call the function to load meter data
         result = load_meter_by_logical_device_number(logical_device_name, divisionID, start_date, end_date)
-        return jsonify({"result": result}), 200
+        if isinstance(result, dict) and result.get('error') == 'unknown_meter':
+            logging.warning(result['message'])
+            return result, 404
+        if isinstance(result, list) and downsample is not None:
+            series = downsample_series(
+                result,
+                downsample.get('columns', DEFAULT_COLUMNS),
+                downsample['points'],
+                downsample.get('method', 'lttb'),
+            )
+            return {"result": {"source_points": len(result), "series": series}}, 200
+        if isinstance(result, list):
+            encode_rows(result)
+        return {"result": result}, 200
 
     except ValueError as ve:
         logging.error(f"Value error during processing: {ve}")
-        return jsonify({'error': 'value_error', 'message': str(ve)}), 422
+        return {'error': 'value_error', 'message': str(ve)}, 422
+    except DatabaseUnavailable as e:
+        logging.error(f"Database unavailable: {e}")
+        return service_unavailable(e)
     except RateLimitException:
         logging.warning("Rate limit exceeded")
-        return jsonify({'error': 'too_many_requests', 'message': 'Rate limit exceeded. Please try again later.'}), 429
+        return {'error': 'too_many_requests', 'message': 'Rate limit exceeded. Please try again later.'}, 429
+    except Exception as e:
+        logging.exception(f"An internal error occurred while processing the request: {e}")
+        return {'error': 'internal_error', 'message': 'An unexpected error occurred.'}, 500
+
+
+@on_exception(expo, RateLimitException, max_tries=3)
+@limits(calls=10, period=60)  # 10 requests per minute
+@blueprint.route('/retrieve-readings', methods=['POST'])
+def secure_data():
+    return json_response(*process_retrieve_readings(request.get_json(silent=True)))
+
+
+def process_sync_readings(data, client_id=None):
+    """Handle a sync request body; returns (payload, status[, headers])."""
+    try:
+        if not isinstance(data, dict):
+            return {'error': 'invalid_request', 'message': 'Request body must be a JSON object.'}, 400
+
+        limit = data.get('limit', DEFAULT_SYNC_LIMIT)
+        if not isinstance(limit, int) or not 0 < limit <= MAX_SYNC_LIMIT:
+            return {
+                'error': 'invalid_limit',
+                'message': f'Limit must be an integer between 1 and {MAX_SYNC_LIMIT}.'
+            }, 400
+
+        if data.get('cursor') is not None:
+            # Continue from the watermarks carried by the cursor
+            divisionID, watermarks = decode_cursor(data['cursor'])
+        else:
+            # First sync: start every meter at the same `since` watermark
+            missing_params = [
+                param for param in ['logical_device_names', 'divisionID', 'since']
+                if data.get(param) is None
+            ]
+            if missing_params:
+                logging.warning(f"Missing parameters: {', '.join(missing_params)}")
+                return {
+                    'error': 'missing_parameters',
+                    'message': f'Missing parameters: {", ".join(missing_params)} (or pass a cursor)'
+                }, 400
+
+            logical_device_names = data['logical_device_names']
+            invalid_names, message = validate_logical_device_names(logical_device_names)
+            if invalid_names is False or invalid_names:
+                return {
+                    'error': 'invalid_logical_device_names',
+                    'message': message or f'Invalid logical device names: {", ".join(map(str, invalid_names))}'
+                }, 400
+
+            try:
+                since = datetime.fromisoformat(data['since'])
+            except (TypeError, ValueError):
+                return {
+                    'error': 'invalid_date_format',
+                    'message': 'since must be an ISO 8601 date or date-time.'
+                }, 400
+            if since.tzinfo is not None:
+                # ServerDateTime is naive server-local time
+                since = since.astimezone().replace(tzinfo=None)
+            if since < datetime.now() - timedelta(days=MAX_SYNC_LOOKBACK_DAYS):
+                return {
+                    'error': 'duration_exceeded',
+                    'message': f'since must not be more than {MAX_SYNC_LOOKBACK_DAYS} days ago.'
+                }, 400
+
+            divisionID = data['divisionID']
+            watermarks = {name: since for name in logical_device_names}
+
+        result = load_meter_changes_since(watermarks, divisionID, limit)
+        if isinstance(result, dict):
+            logging.warning(result['message'])
+            return result, 404 if result['error'] == 'unknown_meter' else 500
+
+        rows, new_watermarks, has_more = result
+        encode_rows(rows)
+        return {
+            "result": rows,
+            "cursor": encode_cursor(divisionID, new_watermarks),
+            "has_more": has_more
+        }, 200
+
+    except InvalidCursor as e:
+        logging.warning(f"Invalid sync cursor: {e}")
+        return {'error': 'invalid_cursor', 'message': str(e)}, 400
+    except DatabaseUnavailable as e:
+        logging.error(f"Database unavailable: {e}")
+        return service_unavailable(e)
     except Exception as e:
         logging.exception(f"An internal error occurred while processing the request: {e}")
-        return jsonify({'error': 'internal_error', 'message': 'An unexpected error occurred.'}), 500
+        return {'error': 'internal_error', 'message': 'An unexpected error occurred.'}, 500
+
+
+@blueprint.route('/retrieve-readings/sync', methods=['POST'])
+@validate_token_and_set_context
+@requires_scope("retrieve-readings")
+@requires_permission("read")
+def sync_readings():
+    return json_response(*process_sync_readings(request.get_json(silent=True)))
@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime
+
+from apps.config import Config
+
+SECRET_KEY = Config.SECRET_KEY
+CURSOR_VERSION = 1
+WATERMARK_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class InvalidCursor(ValueError):
+    """Raised when a sync cursor is malformed or was not issued by this server."""
+
+
+def _sign(body: bytes) -> str:
+    digest = hmac.new(SECRET_KEY.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode('ascii').rstrip('=')
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def encode_cursor(division_id: str, watermarks: dict) -> str:
+    """Encode per-meter ServerDateTime watermarks into an opaque, signed cursor."""
+    state = {
+        'v': CURSOR_VERSION,
+        'div': division_id,
+        'w': {name: watermark.strftime(WATERMARK_FORMAT) for name, watermark in watermarks.items()},
+    }
+    body = json.dumps(state, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return f"{base64.urlsafe_b64encode(body).decode('ascii').rstrip('=')}.{_sign(body)}"
+
+
+def decode_cursor(cursor: str):
+    """Return (division_id, {logical_device_name: watermark}) from a cursor issued by encode_cursor."""
+    try:
+        encoded_body, signature = cursor.split('.', 1)
+        body = _b64decode(encoded_body)
+    except (AttributeError, ValueError) as e:
+        raise InvalidCursor('Cursor is malformed.') from e
+    if not hmac.compare_digest(signature.encode('utf-8'), _sign(body).encode('ascii')):
+        raise InvalidCursor('Cursor signature is invalid.')
+
+    try:
+        state = json.loads(body)
+        version = state['v']
+        division_id = state['div']
+        watermarks = {
+            name: datetime.strptime(watermark, WATERMARK_FORMAT)
+            for name, watermark in state['w'].items()
+        }
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise InvalidCursor('Cursor is malformed.') from e
+    if version != CURSOR_VERSION:
+        raise InvalidCursor('Cursor version is not supported.')
+    return division_id, watermarks
@@ -0,0 +1,121 @@
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile-Request'
+
+
+class StackSampler:
+    """Sample one thread's Python stack every `interval` seconds from a background thread.
+
+    Only the sampled request pays for profiling, and the cost is one stack walk
+    per interval, so it is safe to run under production load. The result is in
+    collapsed-stack format ("outer;inner;leaf count"), ready for flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Profile sampled requests, or requests carrying the admin header, within a per-minute cap."""
+
+    def __init__(self, output_dir, sample_rate, admin_token, max_per_minute, interval):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token
+        self.max_per_minute = max_per_minute
+        self.interval = interval
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _requested(self):
+        if self.admin_token:
+            header = request.headers.get(PROFILE_HEADER)
+            # Compared as bytes: compare_digest rejects non-ASCII str with a TypeError
+            if header and hmac.compare_digest(header.encode('utf-8'), self.admin_token.encode('utf-8')):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _within_cap(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_per_minute:
+                return False
+            self._recent.append(now)
+            return True
+
+    def before_request(self):
+        if self._requested() and self._within_cap():
+            g._profiler = StackSampler(threading.get_ident(), self.interval)
+            g._profiler_started = time.perf_counter()
+            g._profiler.start()
+
+    def teardown_request(self, exc):
+        sampler = g.pop('_profiler', None)
+        if sampler is None:
+            return
+        sampler.stop()
+        elapsed_ms = (time.perf_counter() - g.pop('_profiler_started')) * 1000
+        client_id = (getattr(g, 'token_info', None) or {}).get('client_id', 'anonymous')
+        tags = [request.endpoint or 'unknown', str(client_id)]
+        name = '_'.join([time.strftime('%Y%m%dT%H%M%S'), f"{elapsed_ms:.0f}ms"]
+                        + [re.sub(r'[^A-Za-z0-9.-]+', '-', tag) for tag in tags])
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, f"{name}.collapsed"), 'w') as f:
+                f.write(sampler.collapsed())
+        except OSError as e:
+            logging.error("Could not write request profile: %s", e)
+
+
+def init_profiler(app):
+    """Register the request profiler hooks when profiling is configured."""
+    config = app.config
+    if not config.get('PROFILE_SAMPLE_RATE') and not config.get('PROFILE_ADMIN_TOKEN'):
+        return None
+    profiler = RequestProfiler(
+        output_dir=config['PROFILE_DIR'],
+        sample_rate=config['PROFILE_SAMPLE_RATE'],
+        admin_token=config['PROFILE_ADMIN_TOKEN'],
+        max_per_minute=config['PROFILE_MAX_PER_MINUTE'],
+        interval=config['PROFILE_INTERVAL_SECONDS'],
+    )
+    app.before_request(profiler.before_request)
+    app.teardown_request(profiler.teardown_request)
+    return profiler
@@ -0,0 +1,257 @@
+import datetime
+import decimal
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from pythonjsonlogger import jsonlogger
+from apps.config import Config
+
+TRACE_ENABLED = Config.QUERY_TRACE_ENABLED
+TRACE_ALL = Config.QUERY_TRACE_LOG_ALL
+SLOW_QUERY_THRESHOLD_MS = Config.SLOW_QUERY_THRESHOLD_MS
+CAPTURE_PLANS = Config.SLOW_QUERY_CAPTURE_PLANS
+PLAN_COOLDOWN_SECONDS = Config.SLOW_QUERY_PLAN_COOLDOWN_SECONDS
+
+log_dir = 'Logs'
+QUERY_LOG_FILE = os.path.join(log_dir, 'db_queries.log')
+PLAN_LOG_FILE = os.path.join(log_dir, 'slow_query_plans.log')
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def _json_logger(name, path):
+    """A JSON file logger that does not propagate to the application log; created on first use."""
+    with _loggers_lock:
+        logger = _loggers.get(name)
+        if logger is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = logging.FileHandler(path)
+            handler.setFormatter(jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(message)s'))
+            logger = logging.getLogger(name)
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            logger.propagate = False
+            _loggers[name] = logger
+        return logger
+
+
+_STRING_LITERAL = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Strip literals and collapse placeholder lists so queries differing only in values look alike."""
+    text = _STRING_LITERAL.sub('?', query)
+    text = _NUMBER_LITERAL.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(...)', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+def _sql_type(value):
+    """SQL Server type of a local variable standing in for the parameter `value`."""
+    if isinstance(value, bool):
+        return 'bit'
+    if isinstance(value, int):
+        return 'int' if -2 ** 31 <= value < 2 ** 31 else 'bigint'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, decimal.Decimal):
+        return f"decimal(38, {max(0, -value.as_tuple().exponent)})"
+    if isinstance(value, datetime.datetime):
+        return 'datetime2'
+    if isinstance(value, datetime.date):
+        return 'date'
+    if isinstance(value, (bytes, bytearray)):
+        return 'varbinary(max)'
+    return 'nvarchar(4000)'
+
+
+def plan_statement(query, params):
+    """Rewrite a %s-parameterised query as a batch over declared, unassigned variables.
+
+    The showplan is compiled for unknown values, and its StatementText carries
+    the variable names instead of the request's parameter values.
+    """
+    if not params:
+        return query
+    if not isinstance(params, (tuple, list)):
+        params = (params,)
+    position = iter(range(len(params)))
+    declarations = []
+
+    def placeholder(match):
+        if match.group() == '%%':
+            return '%'
+        i = next(position)
+        if params[i] is None:
+            return 'NULL'
+        declarations.append(f"@p{i} {_sql_type(params[i])}")
+        return f"@p{i}"
+
+    statement = _PLACEHOLDER.sub(placeholder, query)
+    if not declarations:
+        return statement
+    return f"DECLARE {', '.join(declarations)};\n{statement}"
+
+
+def redact_params(params):
+    """Describe parameters by type (and length for strings) without logging their values."""
+    if params is None:
+        return None
+    if not isinstance(params, (tuple, list)):
+        params = (params,)
+    described = [type(value).__name__ for value in params]
+    # Long IN lists would dominate the log line; keep the shape only
+    if len(described) > 10:
+        return described[:10] + [f'... {len(described) - 10} more']
+    return described
+
+
+class QueryTrace:
+    """Timing and size of one cursor's work: connect (pool acquire), execute, fetch."""
+
+    def __init__(self, database, connect_seconds):
+        self.database = database
+        self.connect_seconds = connect_seconds
+        self.execute_seconds = 0.0
+        self.fetch_seconds = 0.0
+        self.rows = 0
+        self.query = None
+        self.params = None
+        self.error = None
+
+    @property
+    def fingerprint(self):
+        return fingerprint(normalize_query(self.query))
+
+    @property
+    def total_ms(self):
+        return (self.connect_seconds + self.execute_seconds + self.fetch_seconds) * 1000
+
+    @property
+    def is_slow(self):
+        return self.query is not None and self.total_ms >= SLOW_QUERY_THRESHOLD_MS
+
+    def record(self):
+        if self.query is None:
+            return
+        normalized = normalize_query(self.query)
+        entry = {
+            "event": "db_query",
+            "database": self.database,
+            "fingerprint": fingerprint(normalized),
+            "query": normalized,
+            "params": redact_params(self.params),
+            "connect_ms": round(self.connect_seconds * 1000, 2),
+            "execute_ms": round(self.execute_seconds * 1000, 2),
+            "fetch_ms": round(self.fetch_seconds * 1000, 2),
+            "total_ms": round(self.total_ms, 2),
+            "rows": self.rows,
+            "slow": self.is_slow,
+        }
+        if self.error:
+            entry["error"] = self.error
+        logger = _json_logger('apps.querytrace', QUERY_LOG_FILE)
+        if self.is_slow:
+            logger.warning(entry)
+        elif TRACE_ALL:
+            logger.info(entry)
+
+
+class TracedCursor:
+    """Cursor wrapper that times execute and fetch calls into a QueryTrace."""
+
+    def __init__(self, cursor, trace):
+        self._cursor = cursor
+        self.trace = trace
+
+    def execute(self, query, params=None):
+        self.trace.query, self.trace.params = query, params
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params)
+        except Exception as e:
+            self.trace.error = type(e).__name__
+            raise
+        finally:
+            self.trace.execute_seconds += time.perf_counter() - started
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.trace.fetch_seconds += time.perf_counter() - started
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        self.trace.rows += len(rows)
+        return rows
+
+    def fetchmany(self, size=None):
+        rows = self._timed_fetch(self._cursor.fetchmany, size) if size else self._timed_fetch(self._cursor.fetchmany)
+        self.trace.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is not None:
+            self.trace.rows += 1
+        return row
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PlanCaptureThrottle:
+    """Admit a showplan capture at most once per query fingerprint every `cooldown` seconds."""
+
+    def __init__(self, cooldown):
+        self.cooldown = cooldown
+        self._captured_at = {}
+        self._lock = threading.Lock()
+
+    def admit(self, trace):
+        key = (trace.database, trace.fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._captured_at.get(key, float('-inf')) < self.cooldown:
+                return False
+            self._captured_at[key] = now
+            # Forget shapes whose cooldown has passed so the map stays small
+            if len(self._captured_at) > 1000:
+                self._captured_at = {k: t for k, t in self._captured_at.items() if now - t < self.cooldown}
+            return True
+
+
+def log_plan(trace, plan_xml):
+    normalized = normalize_query(trace.query)
+    _json_logger('apps.querytrace.plans', PLAN_LOG_FILE).warning({
+        "event": "slow_query_plan",
+        "database": trace.database,
+        "fingerprint": fingerprint(normalized),
+        "query": normalized,
+        "total_ms": round(trace.total_ms, 2),
+        "showplan_xml": plan_xml,
+    })
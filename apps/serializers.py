@@ -0,0 +1,91 @@
+import datetime
+import decimal
+import json
+
+from flask import Response
+from werkzeug.http import http_date
+from apps.config import Config
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+DECIMAL_PLACES = Config.RESPONSE_DECIMAL_PLACES
+DECIMAL_AS_STRING = Config.RESPONSE_DECIMAL_AS_STRING
+DATETIME_FORMAT = Config.RESPONSE_DATETIME_FORMAT
+
+
+def _decimal_converter(places=DECIMAL_PLACES, as_string=DECIMAL_AS_STRING):
+    if places is None:
+        return str if as_string else float
+    exponent = decimal.Decimal(1).scaleb(-places)
+    if as_string:
+        return lambda value: str(value.quantize(exponent, rounding=decimal.ROUND_HALF_UP))
+    return lambda value: float(value.quantize(exponent, rounding=decimal.ROUND_HALF_UP))
+
+
+def _datetime_converter(datetime_format=DATETIME_FORMAT):
+    if datetime_format == 'iso':
+        return lambda value: value.isoformat()
+    # Same representation as Flask's default jsonify
+    return http_date
+
+
+CONVERTERS = {
+    decimal.Decimal: _decimal_converter(),
+    datetime.datetime: _datetime_converter(),
+    datetime.date: _datetime_converter(),
+}
+
+
+def _default(value):
+    """Per-value fallback for anything encode_rows did not convert."""
+    for value_type, convert in CONVERTERS.items():
+        if isinstance(value, value_type):
+            return convert(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def column_converters(rows):
+    """Pick a converter per column from the first non-null value found in each column."""
+    converters = {}
+    pending = None
+    for row in rows:
+        if pending is None:
+            pending = set(row)
+        for column in list(pending):
+            value = row.get(column)
+            if value is None:
+                continue
+            pending.discard(column)
+            convert = CONVERTERS.get(type(value))
+            if convert is not None:
+                converters[column] = (type(value), convert)
+        if not pending:
+            break
+    return converters
+
+
+def encode_rows(rows):
+    """Convert Decimal/datetime columns of a list of row dicts to JSON types, in place.
+
+    The column types are detected once and every column is converted in a
+    single pass, rather than asking the JSON encoder to dispatch on each cell.
+    """
+    for column, (value_type, convert) in column_converters(rows).items():
+        for row in rows:
+            value = row.get(column)
+            if type(value) is value_type:
+                row[column] = convert(value)
+    return rows
+
+
+def json_response(payload, status=200, headers=None):
+    """Serialise `payload` with the fastest available JSON backend."""
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(payload, default=_default, separators=(',', ':'))
+    return Response(body, status=status, headers=headers, mimetype='application/json')
@@ -0,0 +1,77 @@
+import logging
+import time
+from contextlib import contextmanager
+from importlib import import_module
+
+# Heavy modules handed out by lazy_import, by name
+_deferred_modules = {}
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self.load(), attr)
+        # Later lookups of the same attribute bypass __getattr__
+        setattr(self, attr, value)
+        return value
+
+
+def lazy_import(name):
+    """Return `name` as a module that is only imported when first used.
+
+    For modules that are slow to import (jwt, which pulls in cryptography, and
+    numpy) and are not needed until a request uses them; keeps worker startup fast.
+    """
+    module = _deferred_modules.get(name)
+    if module is None:
+        module = _deferred_modules[name] = LazyModule(name)
+    return module
+
+
+class StartupReport:
+    """Wall-clock time of each named startup phase, in the order they ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def as_dict(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "phases": [{"phase": name, "ms": round(seconds * 1000, 2)} for name, seconds in self.phases],
+        }
+
+    def finish(self, app):
+        """Attach the report to the app and log it."""
+        report = self.as_dict()
+        app.extensions['startup_report'] = report
+        logging.getLogger(__name__).info({"event": "startup", **report})
+        return report
+
+
+def preload_deferred_imports(report):
+    """Import the deferred modules now, e.g. in a preforking master so workers inherit them."""
+    for module_name, module in list(_deferred_modules.items()):
+        with report.phase(f'preload {module_name}'):
+            try:
+                module.load()
+            except ImportError as e:
+                logging.warning(f"Could not preload {module_name}: {e}")
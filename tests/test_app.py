@@ -0,0 +1,42 @@
+import pytest
+
+from apps import BLUEPRINT_DEPENDENCIES, register_blueprints
+from apps.startup import StartupReport
+
+
+class FakeApp:
+    def __init__(self, enabled):
+        self.config = {'ENABLED_BLUEPRINTS': enabled}
+        self.blueprints = []
+
+    def register_blueprint(self, blueprint):
+        self.blueprints.append(blueprint.name)
+
+
+@pytest.fixture
+def init_calls(monkeypatch):
+    calls = []
+    for name in BLUEPRINT_DEPENDENCIES:
+        routes = pytest.importorskip(f'apps.{name}.routes')
+        monkeypatch.setattr(routes, 'init_app', lambda app, name=name: calls.append(name), raising=False)
+    return calls
+
+
+def test_batch_alone_initializes_the_modules_it_runs(init_calls):
+    app = FakeApp(('batch',))
+    register_blueprints(app, StartupReport())
+    assert init_calls == ['apiserver', 'bulkmetering', 'ordinarymetering', 'batch']
+    assert app.blueprints == ['batch_blueprint']
+
+
+def test_each_module_initialized_once(init_calls):
+    app = FakeApp(('bulkmetering', 'ordinarymetering', 'apiserver'))
+    register_blueprints(app, StartupReport())
+    assert init_calls == ['apiserver', 'bulkmetering', 'ordinarymetering']
+    assert len(app.blueprints) == 3
+
+
+def test_unknown_blueprint_rejected(init_calls):
+    with pytest.raises(ValueError):
+        register_blueprints(FakeApp(('bulk',)), StartupReport())
+    assert init_calls == []
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from apps.bulkmetering import routes
+from apps.bulkmetering.bulkprocess_api import add_months, pivot_device_months, pivot_device_series
+from apps.bulkmetering.summary import summarize_division
+from apps.serializers import CONVERTERS, json_response
+
+
+def snapshot(name, month, kwh_tot, max_dmnd=None, kwh_exp_tot=0):
+    return {
+        'mtr_nbr': name, 'rdng_date': datetime(2024, month, 1),
+        'kwh_tot': Decimal(kwh_tot), 'kwh_r1': Decimal(kwh_tot), 'kwh_r2': Decimal(0), 'kwh_r3': Decimal(0),
+        'kwh_exp_tot': Decimal(kwh_exp_tot), 'kvarh_tot': Decimal(0), 'kvarh_exp_tot': Decimal(0),
+        'max_dmnd': None if max_dmnd is None else Decimal(max_dmnd), 'max_dmnd_Time': None,
+    }
+
+
+def test_add_months_crosses_year():
+    assert add_months(datetime(2024, 11, 15).date(), 2) == datetime(2025, 1, 1).date()
+
+
+def test_pivot_device_months_aligns_columns_with_months():
+    rows = [snapshot('M1', 1, '10'), snapshot('M1', 3, '30'), snapshot('M2', 2, '5'), snapshot('M2', 9, '90')]
+    months = ['2024-01', '2024-02', '2024-03']
+    pivot = pivot_device_months(rows, months, ['kwh_tot'])
+    assert pivot == {
+        'M1': {'kwh_tot': [Decimal('10'), None, Decimal('30')]},
+        'M2': {'kwh_tot': [None, Decimal('5'), None]},
+    }
+
+
+def test_pivot_device_series_groups_by_device():
+    rows = [snapshot('M1', 1, '10'), snapshot('M2', 1, '5'), snapshot('M1', 2, '20')]
+    series = pivot_device_series(rows)
+    assert [row['kwh_tot'] for row in series['M1']] == [Decimal('10'), Decimal('20')]
+    assert len(series['M2']) == 1
+
+
+def test_summarize_division_totals_and_top_demand():
+    rows = [snapshot('M1', 1, '10', max_dmnd='3'), snapshot('M2', 1, '30', max_dmnd='7', kwh_exp_tot='4'),
+            snapshot('M3', 1, '20')]
+    summary = summarize_division(rows, top_n=5)
+    assert summary['totals']['kwh_tot'] == 60
+    assert summary['tariff_split']['kwh_r1'] == 1
+    assert summary['import_export'] == {'import_kwh': 60, 'export_kwh': 4, 'net_kwh': 56, 'exporting_meters': 1}
+    assert summary['distribution']['max_dmnd']['count'] == 2
+    assert [entry['logical_device_name'] for entry in summary['top_max_demand']] == ['M2', 'M1']
+
+
+@pytest.fixture
+def range_rows(monkeypatch):
+    rows = [snapshot('M1', 1, '10'), snapshot('M1', 2, '20')]
+    monkeypatch.setattr(routes.meter_index, 'resolve', lambda names, division_id, asset_type_id: ({}, {}))
+    monkeypatch.setattr(routes, 'load_bulk_meter_readings_range', lambda *args: [dict(row) for row in rows])
+    return rows
+
+
+def retrieve_range(layout):
+    body = {'logical_device_names': ['M1', 'M2'], 'division_id': 'DD1',
+            'start_date': '2024-01-01', 'end_date': '2024-02-01', 'layout': layout}
+    payload, status = routes.process_bulk_retrieve_readings_range(body, 'test')
+    assert status == 200
+    return json.loads(json_response(payload, status).get_data())
+
+
+@pytest.mark.parametrize('layout', ['series', 'pivot'])
+def test_retrieve_range_layouts(range_rows, layout):
+    response = retrieve_range(layout)
+    assert response['months'] == ['2024-01', '2024-02']
+    m1, m2 = response['result']
+    assert m2['reading_status'] == 'unsuccessful'
+    assert m1['reading_status'] == 'success'
+    expected = [CONVERTERS[Decimal](row['kwh_tot']) for row in range_rows]
+    if layout == 'pivot':
+        assert m1['data'] == {'kwh_tot': expected}
+        assert response['columns'] == ['kwh_tot']
+    else:
+        assert [row['kwh_tot'] for row in m1['data']] == expected
+        assert [row['rdng_date'] for row in m1['data']] == [CONVERTERS[datetime](row['rdng_date']) for row in range_rows]
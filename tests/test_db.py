@@ -0,0 +1,135 @@
+import pytest
+
+from apps import db
+from apps.db import CircuitBreaker, ConnectionPool, DatabaseUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(db.time, 'monotonic', fake)
+    return fake
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, max_size=2, acquire_timeout=0.05, max_idle=300, fail_connect=False):
+        super().__init__('test', {}, max_size, login_timeout=1, query_timeout=1,
+                         acquire_timeout=acquire_timeout, max_idle=max_idle)
+        self.connects = 0
+        self.fail_connect = fail_connect
+
+    def _connect(self):
+        if self.fail_connect:
+            raise db.pymssql.OperationalError('unreachable')
+        self.connects += 1
+        return FakeConnection(self.connects)
+
+
+def test_breaker_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert breaker.retry_after() == 31
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_breaker_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+def test_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_breaker_released_trial_allows_another(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+
+def test_pool_reuses_most_recently_released_connection():
+    pool = FakePool()
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is second
+    assert pool.connects == 2
+
+
+def test_pool_exhausted_raises_database_unavailable():
+    pool = FakePool(max_size=1)
+    pool.acquire()
+    with pytest.raises(DatabaseUnavailable):
+        pool.acquire()
+
+
+def test_pool_discard_frees_capacity():
+    pool = FakePool(max_size=1)
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+    assert conn.closed
+    assert pool.acquire() is not conn
+
+
+def test_pool_closes_idle_expired_connections(clock):
+    pool = FakePool(max_idle=60)
+    conn = pool.acquire()
+    pool.release(conn)
+    clock.now += 61
+    fresh = pool.acquire()
+    assert conn.closed
+    assert fresh is not conn
+
+
+def test_pool_failed_connect_does_not_leak_capacity():
+    pool = FakePool(max_size=1, fail_connect=True)
+    for _ in range(3):
+        with pytest.raises(db.pymssql.OperationalError):
+            pool.acquire()
+    pool.fail_connect = False
+    assert pool.acquire() is not None
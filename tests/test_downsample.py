@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from apps.ordinarymetering.downsample import downsample_series, numeric_columns, validate_downsample
+from apps.ordinarymetering.ordinaryprocess_api import METERING_RELATED_COLUMNS
+
+
+def test_time_columns_cannot_be_downsampled():
+    allowed = numeric_columns(METERING_RELATED_COLUMNS)
+    assert 'MaxDemandPluse' in allowed
+    valid, _ = validate_downsample({'points': 10, 'columns': ['MaxDemandOccuringTimePluse']}, allowed)
+    assert not valid
+
+
+@pytest.mark.parametrize('options', [None, {'points': 2}, {'points': 10, 'method': 'mean'}, {'points': 10, 'columns': []}])
+def test_invalid_options_rejected(options):
+    valid, _ = validate_downsample(options, ['ActivePowerPluse'])
+    assert not valid
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_downsample_reduces_points_and_drops_nulls(method):
+    start = datetime(2024, 1, 1)
+    rows = [{'DateTime': start + timedelta(minutes=i), 'ActivePowerPluse': None if i == 5 else float(i % 7)}
+            for i in range(100)]
+    series = downsample_series(rows, ['ActivePowerPluse'], 10, method)['ActivePowerPluse']
+    assert len(series['values']) <= 10
+    assert series['DateTime'] == sorted(series['DateTime'])
+    assert rows[5]['DateTime'] not in series['DateTime']
+
+
+def test_lttb_keeps_endpoints():
+    start = datetime(2024, 1, 1)
+    rows = [{'DateTime': start + timedelta(minutes=i), 'ActivePowerPluse': float(i % 7)} for i in range(100)]
+    series = downsample_series(rows, ['ActivePowerPluse'], 10)['ActivePowerPluse']
+    assert series['DateTime'][0] == rows[0]['DateTime']
+    assert series['DateTime'][-1] == rows[-1]['DateTime']
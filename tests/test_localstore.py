@@ -0,0 +1,95 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from apps.ordinarymetering.localstore import IntervalReadingStore
+
+START = datetime(2024, 1, 1)
+
+
+class FakeMeterReading:
+    """MeterReading rows of one meter, with the server clock advanced by hand."""
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.now = datetime(2024, 3, 1)
+        self.rows = []
+        self.calls = []
+
+    def insert(self, date_time, value):
+        self.now += timedelta(seconds=1)
+        self.rows.append({'DateTime': date_time, 'ServerDateTime': self.now, 'value': value})
+
+    def _check_store_writable(self):
+        # Remote fetches must not run inside the store's write transaction
+        conn = sqlite3.connect(self.store_path, timeout=0)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def fetch(self, lower, upper):
+        self._check_store_writable()
+        self.calls.append(('fetch', lower, upper))
+        return [dict(row) for row in self.rows if lower <= row['DateTime'] <= upper]
+
+    def fetch_changes(self, since, lower, upper):
+        self._check_store_writable()
+        self.calls.append(('changes', since, lower, upper))
+        return [dict(row) for row in self.rows
+                if lower <= row['DateTime'] <= upper and row['ServerDateTime'] > since]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IntervalReadingStore(str(tmp_path / 'store.db'), max_bytes=10 * 1024 * 1024, refetch_seconds=60)
+
+
+@pytest.fixture
+def remote(store):
+    remote = FakeMeterReading(store.path)
+    for day in range(30):
+        remote.insert(START + timedelta(days=day), day)
+    return remote
+
+
+def read(store, remote, start_day, end_day):
+    rows = store.read(1, START + timedelta(days=start_day), START + timedelta(days=end_day),
+                      remote.fetch, remote.fetch_changes)
+    return [row['value'] for row in rows]
+
+
+def test_served_rows_omit_server_time(store, remote):
+    rows = store.read(1, START, START + timedelta(days=2), remote.fetch, remote.fetch_changes)
+    assert rows == [{'DateTime': START + timedelta(days=day), 'value': day} for day in range(3)]
+
+
+def test_late_inserted_old_reading_is_picked_up(store, remote):
+    assert read(store, remote, 0, 29) == list(range(30))
+    remote.now += timedelta(hours=5)
+    remote.insert(START + timedelta(days=3, hours=12), 'backfilled')
+    assert read(store, remote, 0, 29)[3:6] == [3, 'backfilled', 4]
+
+
+def test_repeated_read_fetches_only_changes(store, remote):
+    read(store, remote, 10, 20)
+    remote.calls.clear()
+    assert read(store, remote, 12, 18) == list(range(12, 19))
+    assert [call[0] for call in remote.calls] == ['changes']
+
+
+def test_wider_window_fetches_only_missing_ends(store, remote):
+    read(store, remote, 10, 20)
+    remote.calls.clear()
+    assert read(store, remote, 5, 25) == list(range(5, 26))
+    assert remote.calls[1:] == [('fetch', START + timedelta(days=5), START + timedelta(days=10)),
+                                ('fetch', START + timedelta(days=20), START + timedelta(days=25))]
+
+
+def test_later_disjoint_window_starts_over(store, remote):
+    read(store, remote, 0, 5)
+    remote.calls.clear()
+    assert read(store, remote, 20, 25) == list(range(20, 26))
+    assert remote.calls == [('fetch', START + timedelta(days=20), START + timedelta(days=25))]
@@ -0,0 +1,34 @@
+from datetime import datetime
+from decimal import Decimal
+
+from apps.querytrace import PlanCaptureThrottle, QueryTrace, normalize_query, plan_statement
+
+
+def test_normalize_query_hides_literals_and_placeholder_lists():
+    query = "SELECT * FROM t WHERE a = 'x' AND b = 42 AND c IN (%s, %s, %s)"
+    assert normalize_query(query) == "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)"
+
+
+def test_plan_statement_keeps_values_out():
+    query = "SELECT * FROM t WHERE a = %s AND b BETWEEN %s AND %s AND c LIKE 'x%%' AND d = %s AND e = %s"
+    params = ('secret-name', datetime(2024, 1, 2), datetime(2024, 2, 2), None, Decimal('1.25'))
+    statement = plan_statement(query, params)
+    assert statement == (
+        "DECLARE @p0 nvarchar(4000), @p1 datetime2, @p2 datetime2, @p4 decimal(38, 2);\n"
+        "SELECT * FROM t WHERE a = @p0 AND b BETWEEN @p1 AND @p2 AND c LIKE 'x%' AND d = NULL AND e = @p4"
+    )
+    assert 'secret-name' not in statement and '2024' not in statement
+
+
+def test_plan_statement_without_params_is_unchanged():
+    assert plan_statement('SELECT 1', None) == 'SELECT 1'
+    assert plan_statement('SELECT 1', ()) == 'SELECT 1'
+
+
+def test_plan_throttle_admits_each_query_shape_once_per_cooldown():
+    throttle = PlanCaptureThrottle(600)
+    first, same_shape, other = QueryTrace('db', 0), QueryTrace('db', 0), QueryTrace('db', 0)
+    first.query, same_shape.query, other.query = 'SELECT a FROM t WHERE x = 1', 'SELECT a FROM t WHERE x = 2', 'SELECT b FROM t'
+    assert throttle.admit(first)
+    assert not throttle.admit(same_shape)
+    assert throttle.admit(other)
@@ -0,0 +1,74 @@
+import pytest
+
+from apps.apiserver import authServer
+from apps.apiserver.authServer import OAuth2AuthorizationServer, OAuth2Client, OAuth2Error
+from apps.apiserver.revocation import BloomFilter, RevocationList, write_revocation_filter
+
+
+def test_bloom_round_trip_keeps_members():
+    bloom = BloomFilter.for_capacity(100)
+    for i in range(100):
+        bloom.add(f'token-{i}')
+    loaded, rest = BloomFilter.from_bytes(bloom.to_bytes() + b'tail')
+    assert all(f'token-{i}' in loaded for i in range(100))
+    assert rest == b'tail'
+
+
+def test_bloom_rejects_other_files():
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(b'XXXX' + bytes(20))
+
+
+def test_revocation_list_reports_published_ids(tmp_path):
+    path = str(tmp_path / 'revoked.bloom')
+    write_revocation_filter(['a', 'b'], path)
+    revoked = RevocationList(path, refresh_seconds=0)
+    assert revoked.is_revoked('a')
+    assert not revoked.is_revoked('c')
+
+
+def test_revocation_list_confirms_filter_hits(tmp_path):
+    path = str(tmp_path / 'revoked.bloom')
+    bloom = write_revocation_filter(['a'], path)
+    # Every bit set: any id is a filter hit, so only the id list can answer
+    with open(path, 'r+b') as f:
+        data = bytearray(f.read())
+        end = len(data) - len(b'a')
+        data[end - len(bloom.bits):end] = b'\xff' * len(bloom.bits)
+        f.seek(0)
+        f.write(data)
+    revoked = RevocationList(path, refresh_seconds=0)
+    assert revoked.is_revoked('a')
+    assert not revoked.is_revoked('not-revoked')
+
+
+def test_revocation_list_without_file(tmp_path):
+    revoked = RevocationList(str(tmp_path / 'missing.bloom'), refresh_seconds=0)
+    assert not revoked.is_revoked('a')
+
+
+def use_auth_db(monkeypatch, path):
+    monkeypatch.setattr(authServer, 'DB_FILE', str(path))
+    authServer.initialize_database()
+
+
+def test_stateless_validator_with_its_own_db_rejects_replaced_token(tmp_path, monkeypatch):
+    filter_path = str(tmp_path / 'revoked.bloom')
+    revoked = RevocationList(filter_path, refresh_seconds=0)
+    monkeypatch.setattr(authServer, 'revocation_list', revoked)
+    monkeypatch.setattr(authServer, 'TOKEN_VALIDATION_MODE', 'stateless')
+    monkeypatch.setattr(authServer, 'schedule_revocation_publish', authServer.publish_revocations)
+    monkeypatch.setattr(authServer, 'write_revocation_filter', lambda ids: write_revocation_filter(ids, filter_path))
+
+    # Issuer node
+    use_auth_db(monkeypatch, tmp_path / 'issuer.db')
+    server = OAuth2AuthorizationServer()
+    client = OAuth2Client('client', 'secret', 'client_credentials', 'read', {})
+    old = server.generate_jwt_token(client, 5)['access_token']
+    new = server.generate_jwt_token(client, 5)['access_token']
+
+    # Validator node: shares the published filter, not the issuer's auth.db
+    use_auth_db(monkeypatch, tmp_path / 'validator.db')
+    assert server.validate_access_token(new)['client_id'] == 'client'
+    with pytest.raises(OAuth2Error):
+        server.validate_access_token(old)
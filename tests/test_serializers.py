@@ -0,0 +1,25 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from apps.serializers import CONVERTERS, encode_rows, json_response
+
+
+def test_encode_rows_converts_typed_columns_in_place():
+    when = datetime(2024, 1, 1, 12, 30)
+    rows = [{'name': 'M1', 'kwh': None, 'at': when}, {'name': 'M2', 'kwh': Decimal('1.5'), 'at': None}]
+    assert encode_rows(rows) is rows
+    assert rows == [
+        {'name': 'M1', 'kwh': None, 'at': CONVERTERS[datetime](when)},
+        {'name': 'M2', 'kwh': CONVERTERS[Decimal](Decimal('1.5')), 'at': None},
+    ]
+
+
+def test_encode_rows_handles_empty_input():
+    assert encode_rows([]) == []
+
+
+def test_json_response_converts_values_encode_rows_did_not():
+    response = json_response({'values': [Decimal('2'), None]}, 201)
+    assert response.status_code == 201
+    assert json.loads(response.get_data()) == {'values': [CONVERTERS[Decimal](Decimal('2')), None]}
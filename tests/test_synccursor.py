@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+
+from apps.ordinarymetering.synccursor import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    watermarks = {'M1': datetime(2024, 1, 1, 12, 0, 0, 123000), 'M2': datetime(2024, 2, 1)}
+    assert decode_cursor(encode_cursor('DD1', watermarks)) == ('DD1', watermarks)
+
+
+@pytest.mark.parametrize('cursor', ['', 'no-dot', 'e30.bad', 12])
+def test_malformed_cursor_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_tampered_cursor_rejected():
+    body, signature = encode_cursor('DD1', {'M1': datetime(2024, 1, 1)}).split('.')
+    forged = encode_cursor('DD2', {'M1': datetime(2024, 1, 1)}).split('.')[0]
+    with pytest.raises(InvalidCursor):
+        decode_cursor(f'{forged}.{signature}')
+    with pytest.raises(InvalidCursor):
+        decode_cursor(f'{body}.café')